@@ -1,26 +1,39 @@
 import click
 
-from cellenics.account import account
-from cellenics.configure_repo import configure_repo
-from cellenics.experiment import experiment
-from cellenics.rds import rds
-from cellenics.rotate_ci import rotate_ci
-from cellenics.stage import stage
-from cellenics.unstage import unstage
+from cellenics.utils.lazy_group import LazyGroup
 
+# subcommands are only imported when invoked, so that e.g. `cellenics rds token`
+# doesn't have to import pandas or PyGithub
+LAZY_SUBCOMMANDS = {
+    "account": (
+        "cellenics.account.account:account",
+        "Manage Cellenics account information.",
+    ),
+    "configure-repo": (
+        "cellenics.configure_repo.configure_repo:configure_repo",
+        "Configures a repository to conform to standards.",
+    ),
+    "experiment": (
+        "cellenics.experiment.experiment:experiment",
+        "Manage Cellenics experiment data and settings.",
+    ),
+    "rds": ("cellenics.rds.rds:rds", "Manage Cellenics RDS databases."),
+    "rotate-ci": (
+        "cellenics.rotate_ci.rotate_ci:rotate_ci",
+        "Rotates and updates repository access credentials.",
+    ),
+    "stage": ("cellenics.stage.stage:stage", "Deploys a custom staging environment."),
+    "unstage": (
+        "cellenics.unstage.unstage:unstage",
+        "Removes a custom staging environment.",
+    ),
+}
 
-@click.group()
+
+@click.group(cls=LazyGroup, lazy_subcommands=LAZY_SUBCOMMANDS)
 def main():
     """🧬 Your one-stop shop for managing Cellenics infrastructure."""
 
 
-main.add_command(configure_repo.configure_repo)
-main.add_command(rotate_ci.rotate_ci)
-main.add_command(stage.stage)
-main.add_command(unstage.unstage)
-main.add_command(experiment.experiment)
-main.add_command(account.account)
-main.add_command(rds.rds)
-
 if __name__ == "__main__":
     main()
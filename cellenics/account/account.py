@@ -4,15 +4,84 @@ import re
 import string
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from secrets import choice
 
+import backoff
 import biomage_programmatic_interface as bpi
-import boto3
 import click
 import pandas as pd
+import requests
+from tabulate import tabulate
+from urllib3.exceptions import NewConnectionError
 
+from ..utils.AuroraClient import AuroraClient, to_sql_array
+from ..utils.aws import get_client, get_session
+from ..utils.cache import Cache
+from ..utils.cognito import (
+    MAX_WORKERS,
+    admin_create_user,
+    admin_set_user_password,
+    get_user_pool_id,
+    get_user_statuses,
+    get_usernames_by_email,
+    get_users_attributes,
+    list_usernames_by_email,
+    list_users,
+)
 from ..utils.constants import DEFAULT_AWS_PROFILE, PRODUCTION, STAGING
 
+SANDBOX_ID = "default"
+USER = "dev_role"
+
+# rows of a user list read into memory at a time
+CHUNK_SIZE = 500
+
+# according to https://emailregex.com/
+EMAIL_REGEX = r"(^[a-zA-Z0-9_.\-]+@[a-zA-Z0-9\-]+\.[a-zA-Z0-9\.\-]+$)"
+
+ACCOUNT_EXISTS_ERROR = "UsernameExistsException: account already exists"
+
+# steps of creating a user, the failed one is recorded in the error report
+CREATE_ACCOUNT_STEP = "create_account"
+SET_PASSWORD_STEP = "set_password"
+
+# statuses of accounts that exist but never got a password, e.g. because
+# setting it failed in an earlier run
+NO_PASSWORD_STATUSES = ["FORCE_CHANGE_PASSWORD", "RESET_REQUIRED"]
+
+# experiments cloned and started at the same time, and attempts for each user
+CLONE_WORKERS = 4
+CLONE_MAX_TRIES = 3
+CLONE_STARTED = "started"
+
+# responses to requests the api rejected before doing anything (expired token,
+# throttling, unavailable), so they are safe to send again
+CLONE_RETRY_STATUS_CODES = [401, 429, 503]
+
+# user attributes and experiment counts in account export snapshots
+EXPORT_ATTRIBUTES = ["name", "email", "custom:agreed_terms", "custom:agreed_emails"]
+SNAPSHOT_COLUMNS = [
+    "username",
+    "status",
+    "enabled",
+    "created_at",
+    "last_modified_at",
+] + EXPORT_ATTRIBUTES
+ACCESS_COLUMNS = [
+    "username",
+    "experiments",
+    "owned_experiments",
+    "last_experiment_created_at",
+]
+
+CSV = "csv"
+PARQUET = "parquet"
+
+# how long to wait for a cognito user import job to finish
+IMPORT_JOB_TIMEOUT = 60 * 60
+IMPORT_JOB_PENDING_STATUSES = ["Created", "Pending", "InProgress", "Stopping"]
+
 
 @click.group()
 def account():
@@ -26,6 +95,19 @@ COGNITO_PRODUCTION_POOL = os.getenv("COGNITO_PRODUCTION_POOL")
 COGNITO_STAGING_POOL = os.getenv("COGNITO_STAGING_POOL")
 
 
+def _get_userpool(input_env, aws_profile, cache=None):
+    """
+    Returns the user pool set in the COGNITO_*_POOL environment variables for
+    input_env, or looks it up in the profile's account if it is not set.
+    """
+    userpool = {
+        PRODUCTION: COGNITO_PRODUCTION_POOL,
+        STAGING: COGNITO_STAGING_POOL,
+    }.get(input_env)
+
+    return userpool or get_user_pool_id(input_env, aws_profile, cache)
+
+
 def generate_password():
     today = time.strftime("%Y-%m-%d")
     return (
@@ -35,24 +117,15 @@ def generate_password():
     )
 
 
-def create_account(full_name, email, aws_profile, userpool):
+def create_account(full_name, email, aws_profile, userpool, cognito=None):
     """
     Creates a new account with the information provided.
     Requires a password change call afterwards."""
 
-    session = boto3.Session(profile_name=aws_profile)
-    cognito = session.client("cognito-idp")
+    if cognito is None:
+        cognito = get_client("cognito-idp", aws_profile)
 
-    cognito.admin_create_user(
-        UserPoolId=userpool,
-        Username=email,
-        MessageAction="SUPPRESS",
-        UserAttributes=[
-            {"Name": "email", "Value": email},
-            {"Name": "name", "Value": full_name},
-            {"Name": "email_verified", "Value": "true"},
-        ],
-    )
+    admin_create_user(cognito, userpool, email, full_name)
 
 
 @click.command()
@@ -94,13 +167,11 @@ def change_password(email, password, aws_profile, userpool):
         print("Error changing password: %s" % error)
 
 
-def _change_password(email, password, aws_profile, userpool):
-    session = boto3.Session(profile_name=aws_profile)
-    cognito = session.client("cognito-idp")
+def _change_password(email, password, aws_profile, userpool, cognito=None):
+    if cognito is None:
+        cognito = get_client("cognito-idp", aws_profile)
 
-    cognito.admin_set_user_password(
-        UserPoolId=userpool, Username=email, Password=password, Permanent=True
-    )
+    admin_set_user_password(cognito, userpool, email, password)
 
 
 @click.command()
@@ -154,18 +225,18 @@ def create_user(full_name, email, password, aws_profile, userpool):
         print("Error creating user: %s" % error)
 
 
-def _create_user(full_name, email, password, userpool, aws_profile):
+def _create_user(full_name, email, password, userpool, aws_profile, cognito=None):
     # format full_name into title and email into lowercase
     full_name = full_name.title()
     email = email.lower()
 
     try:
-        create_account(full_name, email, aws_profile, userpool)
+        create_account(full_name, email, aws_profile, userpool, cognito)
     except Exception as error:
         return error
 
     try:
-        _change_password(email, password, aws_profile, userpool)
+        _change_password(email, password, aws_profile, userpool, cognito)
     except Exception as error:
         return error
 
@@ -183,7 +254,7 @@ def _validate_input(email, full_name):
     if not full_name or pd.isna(full_name):
         return f"ERROR: Full name not provided for user {email}"
 
-    if not re.match(r"(^[a-zA-Z0-9_.\-]+@[a-zA-Z0-9\-]+\.[a-zA-Z0-9\.\-]+$)", email):
+    if not re.match(EMAIL_REGEX, email):
         return f"ERROR: Email {email} does not match regex"
 
 
@@ -223,55 +294,542 @@ def _validate_input(email, full_name):
     show_default=True,
     help="if False, will throw error if account already exists.",
 )
-def create_users_list(user_list, header, input_env, aws_profile, allow_exists):
+@click.option(
+    "--import_job",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Create the accounts with a cognito user import job, for very large lists.",
+)
+@click.option(
+    "--import_role_arn",
+    required=False,
+    default=None,
+    help="Role the import job uses to write its logs to CloudWatch.",
+)
+def create_users_list(
+    user_list,
+    header,
+    input_env,
+    aws_profile,
+    allow_exists,
+    import_job,
+    import_role_arn,
+):
     """
     Creates a new account for each row in the user_list file.
     The file should be in csv format.
     The first column should be the full_name in the format: first_name last_name
     The second column should be the email.
     E.g.: Arthur Dent,arthur_dent@galaxy.gl
+
+    The whole list is validated before any account is created, invalid or
+    duplicated rows are reported in <user_list>.invalid.
+    The new passwords are appended to <user_list>.out. Rows that fail are
+    reported in <user_list>.errors instead of stopping the import, and that file
+    can be given as the user_list to retry them. Accounts that exist without a
+    password (e.g. setting it failed) are given one instead of being skipped.
+    If the import is interrupted, running it again resumes after the last row it
+    went through.
+
+    With --import_job, the accounts are created by a single cognito user import
+    job instead, which isn't bound by the per-second quotas of creating them
+    one at a time. Passwords are then set for the imported users only.
     """
+    if import_job:
+        if not import_role_arn:
+            raise Exception("--import_role_arn is required to run an import job")
+
+        _import_users_list(
+            user_list, header, input_env, aws_profile, allow_exists, import_role_arn
+        )
+        return
+
     _create_users_list(user_list, header, input_env, aws_profile, allow_exists)
 
 
+def _read_checkpoint(checkpoint_path):
+    """
+    Returns the number of rows a previous import went through, 0 if none.
+    """
+    if not os.path.exists(checkpoint_path):
+        return 0
+
+    with open(checkpoint_path) as f:
+        return int(f.read())
+
+
+def _write_checkpoint(checkpoint_path, rows_done):
+    # replace the file atomically, so an interrupted import never leaves a
+    # partially written checkpoint behind
+    with open(checkpoint_path + ".tmp", "w") as f:
+        f.write(str(rows_done))
+
+    os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+
+def _read_user_list(user_list, header, rows_done=0):
+    """
+    Reads the user list in chunks, skipping the first rows_done rows.
+    Yields each chunk as a DataFrame with the row number, full name and email,
+    with names in title case and emails in lowercase.
+    """
+    reader = pd.read_csv(
+        user_list,
+        header=header,
+        quoting=csv.QUOTE_ALL,
+        dtype=str,
+        usecols=[0, 1],
+        chunksize=CHUNK_SIZE,
+    )
+
+    for chunk in reader:
+        chunk.columns = ["full_name", "email"]
+        chunk.insert(0, "row", chunk.index + 1)
+
+        chunk["full_name"] = chunk["full_name"].str.title().str.strip()
+        chunk["email"] = chunk["email"].str.lower().str.strip()
+
+        yield chunk[chunk["row"] > rows_done]
+
+
+def _validate_users(users):
+    """
+    Vectorized version of _validate_input over a DataFrame of users.
+    Returns the error of each user, None for the valid ones.
+    """
+    emails = users["email"].fillna("")
+    full_names = users["full_name"].fillna("")
+
+    errors = pd.Series(None, index=users.index, dtype=object)
+
+    # later checks take precedence, in the reverse order of _validate_input
+    invalid_email = ~emails.str.match(EMAIL_REGEX)
+    errors[invalid_email] = "ERROR: Email " + emails + " does not match regex"
+
+    missing_name = full_names == ""
+    errors[missing_name] = "ERROR: Full name not provided for user " + emails
+
+    missing_email = emails == ""
+    errors[missing_email] = "ERROR: Email not provided for user " + full_names
+
+    return errors
+
+
+def _validate_user_list(user_list, header, rows_done=0):
+    """
+    Validates every row of the user list in one pass, before any account is
+    created. Rows with an invalid email or name, or with an email that showed up
+    in an earlier row, are returned with their error.
+    """
+    invalid = []
+    seen = set()
+
+    for users in _read_user_list(user_list, header, rows_done):
+        errors = _validate_users(users)
+
+        duplicated = users["email"].duplicated() | users["email"].isin(seen)
+        duplicated &= errors.isna()
+        errors[duplicated] = "ERROR: Email " + users["email"] + " is duplicated"
+
+        seen.update(users["email"].dropna())
+        invalid.append(users.assign(error=errors)[errors.notna()])
+
+    return pd.concat(invalid)
+
+
+def _exit_if_invalid(user_list, header, rows_done=0):
+    invalid = _validate_user_list(user_list, header, rows_done)
+
+    if invalid.empty:
+        return
+
+    invalid_path = user_list + ".invalid"
+    invalid.to_csv(invalid_path, index=False)
+
+    for error in invalid["error"]:
+        print(error)
+
+    print(
+        f"{len(invalid)} rows are not valid, see {invalid_path}. "
+        "No accounts were created."
+    )
+    sys.exit(1)
+
+
+def _without_password(statuses):
+    return {
+        email for email, status in statuses.items() if status in NO_PASSWORD_STATUSES
+    }
+
+
+def _print_plan(emails, statuses, allow_exists):
+    without_password = _without_password(statuses)
+    skipped = [
+        email for email in emails if email in statuses and email not in without_password
+    ]
+    passwords = [email for email in emails if email in without_password]
+
+    print(
+        f"Creating {len(emails) - len(skipped) - len(passwords)} accounts, "
+        f"setting the password of {len(passwords)} that exist without one, "
+        f"skipping {len(skipped)} that already exist"
+    )
+
+    if skipped and not allow_exists:
+        print(
+            click.style(
+                "Existing accounts will be reported as errors, use --allow_exists True "
+                "to skip them silently",
+                fg="yellow",
+            )
+        )
+
+    for email in skipped:
+        print(f"  skip {email}")
+
+
+def _write_result(out, errors, user, password, step, error, allow_exists):
+    """
+    Writes the outcome of creating a user to the .out file or the error report,
+    along with the step that failed. The report starts with the name and email,
+    so it can be retried as a user list.
+    Returns whether the user failed.
+    """
+    row, full_name, email = user
+
+    if not error:
+        print("%s,%s,%s" % (full_name, email, password))
+        out.write("%s,%s,%s\n" % (full_name, email, password))
+    elif "UsernameExistsException" in str(error) and allow_exists:
+        out.write("%s,%s,Already have an account\n" % (full_name, email))
+    else:
+        print(f"Error creating user {email} in row {row} at {step}: {error}")
+        errors.writerow([full_name, email, row, step, error])
+        return True
+
+    return False
+
+
 def _create_users_list(user_list, header, input_env, aws_profile, allow_exists):
-    if not COGNITO_STAGING_POOL and not COGNITO_PRODUCTION_POOL:
+    # a single client is thread-safe and reuses its connections across users
+    cognito = get_client("cognito-idp", aws_profile)
+    userpool = _get_userpool(input_env, aws_profile, Cache())
+
+    checkpoint_path = user_list + ".checkpoint"
+    errors_path = user_list + ".errors"
+
+    rows_done = _read_checkpoint(checkpoint_path)
+
+    failed = 0
+
+    # a resumed import adds to the error report of the previous runs
+    mode = "w"
+    if rows_done:
+        mode = "a"
+        print(f"Resuming import after row {rows_done}, found in {checkpoint_path}")
+
+        with open(errors_path) as f:
+            failed = len(list(csv.reader(f)))
+
+    _exit_if_invalid(user_list, header, rows_done)
+
+    # find the existing accounts up front instead of failing to create them
+    emails = [
+        email
+        for users in _read_user_list(user_list, header, rows_done)
+        for email in users["email"]
+    ]
+    statuses = get_user_statuses(cognito, userpool, emails)
+    without_password = _without_password(statuses)
+
+    _print_plan(emails, statuses, allow_exists)
+
+    def create(user):
+        _, full_name, email = user
+
+        if email in statuses and email not in without_password:
+            return None, CREATE_ACCOUNT_STEP, ACCOUNT_EXISTS_ERROR
+
+        # accounts created by an earlier run only need their password
+        if email not in statuses:
+            try:
+                create_account(full_name, email, aws_profile, userpool, cognito)
+            except Exception as error:
+                return None, CREATE_ACCOUNT_STEP, error
+
+        password = generate_password()
+
+        try:
+            _change_password(email, password, aws_profile, userpool, cognito)
+        except Exception as error:
+            return None, SET_PASSWORD_STEP, error
+
+        return password, None, None
+
+    # the passwords of earlier runs are only in the .out file, never truncate it
+    with open(user_list + ".out", "a") as out, open(
+        errors_path, mode
+    ) as errors_file, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        errors = csv.writer(errors_file)
+
+        for users in _read_user_list(user_list, header, rows_done):
+            users = list(users.itertuples(index=False, name=None))
+
+            # map yields in input order, so the .out file keeps the order of the
+            # list and every row up to the checkpoint is done
+            for user, (password, step, error) in zip(
+                users, executor.map(create, users)
+            ):
+                failed += _write_result(
+                    out, errors, user, password, step, error, allow_exists
+                )
+
+                out.flush()
+                errors_file.flush()
+                _write_checkpoint(checkpoint_path, user[0])
+
+    # the import went through every row, a new run starts from scratch
+    os.remove(checkpoint_path)
+
+    if failed:
+        print(
+            f"{failed} rows could not be imported, see {errors_path}. "
+            f"Retry them with --user_list {errors_path}"
+        )
+        sys.exit(1)
+
+    os.remove(errors_path)
+
+
+def _set_passwords(cognito, userpool, usernames):
+    """
+    Sets a newly generated password for each of the users concurrently.
+    Yields (password, error) in the same order as usernames, as soon as each
+    user and the ones before it are done.
+    """
+
+    def set_password(username):
+        password = generate_password()
+
+        try:
+            admin_set_user_password(cognito, userpool, username, password)
+        except Exception as error:
+            return password, error
+
+        return password, None
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        yield from executor.map(set_password, usernames)
+
+
+def _to_import_csv(users, csv_header):
+    """
+    Builds the csv a cognito user import job expects out of the users.
+    Every column of the pool's header is present, only the ones we know are filled.
+    """
+    import_users = pd.DataFrame("", index=users.index, columns=csv_header)
+
+    values = {
+        "cognito:username": users["email"],
+        "name": users["full_name"],
+        "email": users["email"],
+        "email_verified": "true",
+        "phone_number_verified": "false",
+        "cognito:mfa_enabled": "false",
+    }
+
+    for column, value in values.items():
+        if column in import_users:
+            import_users[column] = value
+
+    return import_users.to_csv(index=False)
+
+
+@backoff.on_predicate(
+    backoff.expo,
+    lambda job: job["Status"] in IMPORT_JOB_PENDING_STATUSES,
+    max_value=30,
+    max_time=IMPORT_JOB_TIMEOUT,
+)
+def _wait_for_import_job(cognito, userpool, job_id):
+    return cognito.describe_user_import_job(UserPoolId=userpool, JobId=job_id)[
+        "UserImportJob"
+    ]
+
+
+def _run_import_job(cognito, userpool, users, import_role_arn):
+    csv_header = cognito.get_csv_header(UserPoolId=userpool)["CSVHeader"]
+
+    job = cognito.create_user_import_job(
+        JobName=f"cellenics-import-{time.strftime('%Y%m%d-%H%M%S')}",
+        UserPoolId=userpool,
+        CloudWatchLogsRoleArn=import_role_arn,
+    )["UserImportJob"]
+
+    response = requests.put(
+        job["PreSignedUrl"],
+        data=_to_import_csv(users, csv_header).encode(),
+        headers={"x-amz-server-side-encryption": "aws:kms"},
+    )
+    response.raise_for_status()
+
+    cognito.start_user_import_job(UserPoolId=userpool, JobId=job["JobId"])
+    print(f"Started import job {job['JobId']} for {len(users)} users...")
+
+    job = _wait_for_import_job(cognito, userpool, job["JobId"])
+
+    if job["Status"] != "Succeeded":
         raise Exception(
-            "COGNITO_STAGING_POOL or COGNITO_PRODUCTION_POOL"
-            + " environment variables must be set!"
+            f"Import job {job['JobId']} finished as {job['Status']}: "
+            f"{job.get('CompletionMessage')}"
         )
-    userpool = None
-    if input_env == PRODUCTION:
-        userpool = COGNITO_PRODUCTION_POOL
-    elif input_env == STAGING:
-        userpool = COGNITO_STAGING_POOL
-
-    with open(user_list + ".out", "w") as out:
-        df = pd.read_csv(user_list, header=header, quoting=csv.QUOTE_ALL)
-        for _, full_name, email in df.itertuples():
-            full_name = full_name.title().strip()
-            email = email.lower().strip()
-
-            error = _validate_input(email, full_name)
-            if error:
-                print(error)
-                sys.exit()
-
-            password = generate_password()
-
-            error = _create_user(full_name, email, password, userpool, aws_profile)
-
-            if error:
-                if "UsernameExistsException" in str(error) and allow_exists:
-                    out.write("%s,%s,Already have an account\n" % (full_name, email))
-                    continue
-                else:
-                    print(f"Error creating user {email} with password {password}")
-                    print(error)
-                    sys.exit(1)
 
-            print("%s,%s,%s" % (full_name, email, password))
-            out.write("%s,%s,%s\n" % (full_name, email, password))
+    if job.get("FailedUsers"):
+        print(
+            click.style(
+                f"{job['FailedUsers']} users could not be imported, see the logs of "
+                f"job {job['JobId']} in CloudWatch",
+                fg="yellow",
+            )
+        )
+
+
+def _import_users_list(
+    user_list, header, input_env, aws_profile, allow_exists, import_role_arn
+):
+    cognito = get_client("cognito-idp", aws_profile)
+    userpool = _get_userpool(input_env, aws_profile, Cache())
+    errors_path = user_list + ".errors"
+
+    _exit_if_invalid(user_list, header)
+
+    users = pd.concat(_read_user_list(user_list, header), ignore_index=True)
+    users["step"] = None
+    users["error"] = None
+
+    statuses = get_user_statuses(cognito, userpool, users["email"])
+    _print_plan(list(users["email"]), statuses, allow_exists)
+
+    existing = users["email"].isin(statuses)
+    without_password = users["email"].isin(_without_password(statuses))
+
+    users.loc[existing & ~without_password, "step"] = CREATE_ACCOUNT_STEP
+    users.loc[existing & ~without_password, "error"] = ACCOUNT_EXISTS_ERROR
+    new_users = users[~existing]
+
+    users["password"] = None
+
+    if not new_users.empty:
+        _run_import_job(cognito, userpool, new_users, import_role_arn)
+
+    # imported users, and those an earlier run created without a password, need
+    # one before they can sign in
+    needs_password = users[~existing | without_password]
+
+    if not needs_password.empty:
+        results = list(_set_passwords(cognito, userpool, needs_password["email"]))
+        users.loc[needs_password.index, "password"] = [
+            password if not error else None for password, error in results
+        ]
+        users.loc[needs_password.index, "step"] = [
+            SET_PASSWORD_STEP if error else None for _, error in results
+        ]
+        users.loc[needs_password.index, "error"] = [
+            str(error) if error else None for _, error in results
+        ]
+
+    failed = 0
+
+    with open(user_list + ".out", "a") as out, open(errors_path, "w") as errors_file:
+        errors = csv.writer(errors_file)
+
+        for row, full_name, email, step, error, password in users.itertuples(
+            index=False
+        ):
+            if pd.isna(error):
+                error = None
+
+            failed += _write_result(
+                out,
+                errors,
+                (row, full_name, email),
+                password,
+                step,
+                error,
+                allow_exists,
+            )
+
+    if failed:
+        print(
+            f"{failed} rows could not be imported, see {errors_path}. "
+            f"Retry them with --user_list {errors_path}"
+        )
+        sys.exit(1)
+
+    os.remove(errors_path)
+
+
+def _was_not_processed(error):
+    """
+    Returns whether the request that failed with the error never reached the api
+    or was rejected by it, so that sending it again can't repeat its effects.
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # other connection errors (e.g. a dropped response) might come after the
+        # api did the work
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is not None and response.status_code in CLONE_RETRY_STATUS_CODES
+
+    return False
+
+
+# neither cloning nor starting the pipeline is idempotent, a retried request that
+# the api already processed would clone the experiment or run it again
+@backoff.on_exception(
+    backoff.expo,
+    Exception,
+    max_tries=CLONE_MAX_TRIES,
+    giveup=lambda error: not _was_not_processed(error),
+)
+def _clone_experiment(experiment, user_id):
+    return experiment.clone(user_id)
+
+
+@backoff.on_exception(
+    backoff.expo,
+    Exception,
+    max_tries=CLONE_MAX_TRIES,
+    giveup=lambda error: not _was_not_processed(error),
+)
+def _run_experiment(experiment):
+    experiment.run()
+
+
+def _clone_and_run(experiment, user_id):
+    """
+    Clones the experiment for the user and starts processing the clone.
+    Returns the id of the clone and the status of the user.
+    """
+    try:
+        new_experiment = _clone_experiment(experiment, user_id)
+    except Exception as error:
+        return None, f"clone failed: {error}"
+
+    # retrying separately so that a failed run doesn't clone the experiment again
+    try:
+        _run_experiment(new_experiment)
+    except Exception as error:
+        return new_experiment.id, f"run failed: {error}"
+
+    return new_experiment.id, CLONE_STARTED
 
 
 @click.command()
@@ -340,18 +898,23 @@ def create_process_experiment_list(
     The first column should be the full_name in the format: first_name last_name
     The second column should be the email.
     E.g.: Arthur Dent, arthur_dent@galaxy.gl
-    """
 
-    cognito_pool = COGNITO_PRODUCTION_POOL
+    The experiment is cloned and run for several users at a time. The outcome
+    for each user is written to <user_list>.results.
+    """
 
     # creating the users
     print("Creating users from the csv file")
     _create_users_list(user_list, None, "production", aws_profile, allow_exists)
 
-    session = boto3.Session(profile_name=aws_profile)
-    client = session.client("cognito-idp")
+    client = get_client("cognito-idp", aws_profile)
     created_users = pd.read_csv(user_list + ".out", header=None, quoting=csv.QUOTE_ALL)
 
+    # the .out file keeps the rows of earlier runs too
+    emails = list(dict.fromkeys(created_users[1]))
+    userpool = _get_userpool(PRODUCTION, aws_profile, Cache())
+    usernames = list_usernames_by_email(client, userpool, emails)
+
     # creating the experiment and uploading samples
     admin_connection = bpi.Connection(admin_email, admin_password, instance_url)
 
@@ -360,21 +923,419 @@ def create_process_experiment_list(
     experiment.upload_samples(samples_path)
 
     print("Cloning and running the experiment for each user")
-    for _, name, email, password in created_users.itertuples():
-        to_user_id = client.admin_get_user(UserPoolId=cognito_pool, Username=email)[
-            "Username"
-        ]
-        new_experiment = experiment.clone(to_user_id)
-        new_experiment.run()
-        print(
-            "Experiment ",
-            new_experiment,
-            " cloned and started processing for user ",
-            to_user_id,
+    results_path = user_list + ".results"
+    failed = 0
+
+    with open(results_path, "w") as results_file, ThreadPoolExecutor(
+        max_workers=CLONE_WORKERS
+    ) as executor:
+        results = csv.writer(results_file)
+        results.writerow(["email", "user_id", "experiment_id", "status"])
+
+        futures = {}
+        for email in emails:
+            if email not in usernames:
+                results.writerow([email, None, None, "account not found"])
+                failed += 1
+                continue
+
+            future = executor.submit(_clone_and_run, experiment, usernames[email])
+            futures[future] = email
+
+        for done, future in enumerate(as_completed(futures), 1):
+            email = futures[future]
+            experiment_id, status = future.result()
+
+            if status != CLONE_STARTED:
+                failed += 1
+
+            print(f"[{done}/{len(futures)}] {email}: {status}")
+            results.writerow([email, usernames[email], experiment_id, status])
+            results_file.flush()
+
+    print(f"Results written to {results_path}")
+
+    if failed:
+        print(click.style(f"{failed} users didn't get their experiment", fg="red"))
+        sys.exit(1)
+
+
+@click.command()
+@click.option(
+    "--user_list",
+    required=True,
+    help="User list containing user and email of the accounts in csv.",
+)
+@click.option(
+    "--header",
+    required=False,
+    default=None,
+    help="""Header parameter passed to pandas read_csv function. Use 'None'
+    if no headers are present, otherwise specify the header row number with an int.""",
+)
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=STAGING,
+    show_default=True,
+    help="Input environment of the accounts.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+def change_passwords(user_list, header, input_env, aws_profile):
+    """
+    Sets a newly generated password for the account of each row in the user_list
+    file, in the same format as for create-users-list.
+    The new passwords are written to <user_list>.passwords as they are set.
+    E.g.: Arthur Dent,arthur_dent@galaxy.gl
+    """
+    cognito = get_client("cognito-idp", aws_profile)
+    userpool = _get_userpool(input_env, aws_profile, Cache())
+
+    _exit_if_invalid(user_list, header)
+
+    passwords_path = user_list + ".passwords"
+    failed = 0
+
+    with open(passwords_path, "w") as out:
+        for users in _read_user_list(user_list, header):
+            results = _set_passwords(cognito, userpool, users["email"])
+
+            for (row, full_name, email), (password, error) in zip(
+                users.itertuples(index=False, name=None), results
+            ):
+                if error:
+                    print(f"Error changing password of {email} in row {row}: {error}")
+                    failed += 1
+                    continue
+
+                print("%s,%s,%s" % (full_name, email, password))
+                out.write("%s,%s,%s\n" % (full_name, email, password))
+                out.flush()
+
+    if failed:
+        print(f"{failed} passwords could not be changed")
+        sys.exit(1)
+
+
+def _read_emails(emails, emails_file):
+    emails = list(emails)
+
+    if emails_file:
+        with open(emails_file) as f:
+            emails += [line.strip() for line in f if line.strip()]
+
+    if not emails:
+        raise Exception("Provide at least one email with -e or --emails_file")
+
+    # drop duplicates, keeping the order
+    return list(dict.fromkeys(email.lower() for email in emails))
+
+
+def _get_experiments_by_user(aurora_client, usernames):
+    """
+    Returns the experiments each of the users has access to, in one query.
+    """
+    return aurora_client.select_or_empty(
+        f"""SELECT ua.user_id, e.id as experiment_id, \
+            e.name as experiment_name, ua.access_role, e.created_at \
+        FROM user_access ua JOIN experiment e ON e.id = ua.experiment_id \
+        WHERE ua.user_id = ANY({to_sql_array(usernames)}) \
+        ORDER BY e.created_at DESC"""
+    )
+
+
+@click.command()
+@click.option(
+    "-e",
+    "--email",
+    "emails",
+    multiple=True,
+    required=False,
+    help="Email of the user to list experiments for, can be given multiple times.",
+)
+@click.option(
+    "--emails_file",
+    required=False,
+    default=None,
+    help="File with one email per line to list experiments for.",
+)
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=PRODUCTION,
+    show_default=True,
+    help="Input environment to look the users up in.",
+)
+@click.option(
+    "--no_cache",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Rebuild the index of the user pool instead of using the cached one.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+def experiments(emails, emails_file, input_env, no_cache, aws_profile):
+    """
+    Lists the experiments the users with the given emails have access to.
+    Emails are resolved through a local index of the user pool, so only users
+    created since the index was built are looked up in cognito.
+
+    E.g.:
+    cellenics account experiments -e arthur_dent@galaxy.gl -i production
+    cellenics account experiments --emails_file users.txt
+    """
+
+    emails = _read_emails(emails, emails_file)
+
+    for email in emails:
+        error = _validate_input(email, email)
+        if error:
+            raise Exception(error)
+
+    cache = Cache()
+    if no_cache:
+        cache = None
+
+    cognito = get_client("cognito-idp", aws_profile)
+    userpool = _get_userpool(input_env, aws_profile, cache)
+
+    usernames = get_usernames_by_email(cognito, userpool, emails, cache)
+
+    for email, username in usernames.items():
+        if username is None:
+            print(click.style(f"No user found with email {email}", fg="yellow"))
+
+    users = {username: email for email, username in usernames.items() if username}
+    if not users:
+        return
+
+    with AuroraClient(
+        SANDBOX_ID, USER, get_session(aws_profile).region_name, input_env, aws_profile
+    ) as aurora_client:
+        rows = _get_experiments_by_user(aurora_client, list(users))
+
+    print(
+        tabulate(
+            [
+                [
+                    users[row["user_id"]],
+                    row["experiment_id"],
+                    row["experiment_name"],
+                    row["access_role"],
+                    row["created_at"],
+                ]
+                for row in rows
+            ],
+            ["email", "experiment_id", "experiment_name", "access_role", "created_at"],
+            tablefmt="simple",
+        )
+    )
+
+
+def _get_user_row(user, attributes):
+    row = {
+        "username": user["Username"],
+        "status": user["UserStatus"],
+        "enabled": user["Enabled"],
+        "created_at": pd.Timestamp(user["UserCreateDate"]),
+        "last_modified_at": pd.Timestamp(user["UserLastModifiedDate"]),
+    }
+
+    for name in EXPORT_ATTRIBUTES:
+        row[name] = attributes.get(name)
+
+    return row
+
+
+def _list_pool_users(cognito, userpool, snapshot=None):
+    """
+    Lists every user of the pool with its exported attributes. Given the
+    snapshot of a previous export, only the attributes of users modified since
+    then are fetched, the rest are taken from the snapshot.
+    """
+    if snapshot is None:
+        return pd.DataFrame(
+            [
+                _get_user_row(
+                    user, {attr["Name"]: attr["Value"] for attr in user["Attributes"]}
+                )
+                for user in list_users(cognito, userpool)
+            ],
+            columns=SNAPSHOT_COLUMNS,
         )
 
+    # ListUsers can't filter by modification date, so the whole pool is still
+    # listed, but without attributes to keep the pages small
+    users = list(list_users(cognito, userpool, attributes=["sub"]))
+
+    previous = snapshot.set_index("username")
+
+    changed = [
+        user["Username"]
+        for user in users
+        if user["Username"] not in previous.index
+        or pd.Timestamp(user["UserLastModifiedDate"])
+        > previous.at[user["Username"], "last_modified_at"]
+    ]
+
+    print(f"{len(changed)} of {len(users)} users changed since the last export")
+
+    attributes = get_users_attributes(cognito, userpool, changed)
+
+    rows = []
+    for user in users:
+        username = user["Username"]
+
+        if username in attributes:
+            rows.append(_get_user_row(user, attributes[username]))
+        else:
+            rows.append(_get_user_row(user, previous.loc[username].to_dict()))
+
+    return pd.DataFrame(rows, columns=SNAPSHOT_COLUMNS)
+
+
+def _get_access_counts(aurora_client):
+    """
+    Returns how many experiments each user has access to and owns, in one query.
+    """
+    rows = aurora_client.select_or_empty(
+        """SELECT ua.user_id as username, COUNT(*) as experiments, \
+            COUNT(*) FILTER (WHERE ua.access_role = 'owner') as owned_experiments, \
+            MAX(e.created_at) as last_experiment_created_at \
+        FROM user_access ua JOIN experiment e ON e.id = ua.experiment_id \
+        GROUP BY ua.user_id"""
+    )
+
+    return pd.DataFrame(rows, columns=ACCESS_COLUMNS)
+
+
+def _read_snapshot(output_path, output_format):
+    if not os.path.exists(output_path):
+        return None
+
+    if output_format == PARQUET:
+        snapshot = pd.read_parquet(output_path)
+    else:
+        snapshot = pd.read_csv(output_path)
+
+    snapshot["last_modified_at"] = pd.to_datetime(
+        snapshot["last_modified_at"], utc=True
+    )
+
+    return snapshot[SNAPSHOT_COLUMNS]
+
+
+def _write_snapshot(users, output_path, output_format):
+    if output_format != PARQUET:
+        users.to_csv(output_path, index=False)
+        return
+
+    try:
+        users.to_parquet(output_path, index=False)
+    except ImportError:
+        raise Exception(
+            "parquet export requires the pyarrow package, install it with "
+            '"pip install cellenics-utils[export]"'
+        )
+
+
+@click.command()
+@click.option(
+    "-o",
+    "--output_path",
+    required=True,
+    help="File to write the snapshot to. An existing snapshot is refreshed.",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    required=False,
+    default=CSV,
+    show_default=True,
+    type=click.Choice([CSV, PARQUET]),
+    help="Format of the snapshot.",
+)
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=PRODUCTION,
+    show_default=True,
+    help="Input environment to export the users of.",
+)
+@click.option(
+    "--full",
+    required=False,
+    is_flag=True,
+    default=False,
+    help="Export every user again instead of refreshing an existing snapshot.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+def export(output_path, output_format, input_env, full, aws_profile):
+    """
+    Exports a snapshot of the users in the user pool, with the number of
+    experiments each of them has access to.
+    If the snapshot already exists, only the users modified since it was
+    exported are fetched again.
+
+    E.g.:
+    cellenics account export -o users.csv -i production
+    cellenics account export -o users.parquet -f parquet
+    """
+    snapshot = None
+    if not full:
+        snapshot = _read_snapshot(output_path, output_format)
+
+    cognito = get_client("cognito-idp", aws_profile)
+    userpool = _get_userpool(input_env, aws_profile, Cache())
+
+    users = _list_pool_users(cognito, userpool, snapshot)
+
+    with AuroraClient(
+        SANDBOX_ID, USER, get_session(aws_profile).region_name, input_env, aws_profile
+    ) as aurora_client:
+        access_counts = _get_access_counts(aurora_client)
+
+    users = users.merge(access_counts, on="username", how="left")
+    users[["experiments", "owned_experiments"]] = (
+        users[["experiments", "owned_experiments"]].fillna(0).astype(int)
+    )
+
+    _write_snapshot(users, output_path, output_format)
+
+    click.echo(
+        click.style(f"{len(users)} users exported to {output_path}.", fg="green")
+    )
+
 
 account.add_command(create_user)
 account.add_command(change_password)
+account.add_command(change_passwords)
 account.add_command(create_users_list)
 account.add_command(create_process_experiment_list)
+account.add_command(experiments)
+account.add_command(export)
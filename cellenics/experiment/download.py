@@ -2,14 +2,16 @@ import json
 import os
 from pathlib import Path
 
-import boto3
 import click
 
 from ..utils.AuroraClient import AuroraClient
+from ..utils.aws import get_account_id, get_client, get_session
+from ..utils.cache import Cache
 from ..utils.constants import (
     CELLSETS_BUCKET,
     DEFAULT_AWS_PROFILE,
     FILTERED_CELLS_BUCKET,
+    METADATA_CACHE_TTL,
     PROCESSED_FILES_BUCKET,
     RAW_FILES_BUCKET,
     SAMPLES_BUCKET,
@@ -37,36 +39,35 @@ file_type_to_name_map = {
 DATA_LOCATION = os.getenv("CELLENICS_DATA_PATH", "./data")
 
 
-# Copied from https://stackoverflow.com/a/62945526
-def _download_folder(bucket_name, s3_path, local_folder_path, boto3_session):
-    s3 = boto3_session.resource("s3")
-    bucket = s3.Bucket(bucket_name)
+# Adapted from https://stackoverflow.com/a/62945526
+def _download_folder(bucket_name, s3_path, local_folder_path, s3client):
+    paginator = s3client.get_paginator("list_objects_v2")
 
-    for object in bucket.objects.filter(Prefix=s3_path):
-        # Join local path with subsequent s3 path
-        local_file_path = os.path.join(
-            local_folder_path, os.path.relpath(object.key, s3_path)
-        )
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=s3_path):
+        for s3_object in page.get("Contents", []):
+            key = s3_object["Key"]
 
-        # Create local folder
-        if not os.path.exists(os.path.dirname(local_file_path)):
-            os.makedirs(os.path.dirname(local_file_path))
+            # Join local path with subsequent s3 path
+            local_file_path = os.path.join(
+                local_folder_path, os.path.relpath(key, s3_path)
+            )
 
-        if object.key[-1] == "/":
-            continue
+            # Create local folder
+            if not os.path.exists(os.path.dirname(local_file_path)):
+                os.makedirs(os.path.dirname(local_file_path))
 
-        print(f"Downloading {object.key}")
+            if key[-1] == "/":
+                continue
 
-        bucket.download_file(object.key, local_file_path)
+            print(f"Downloading {key}")
 
+            s3client.download_file(bucket_name, key, local_file_path)
 
-def _download_file(bucket, s3_path, local_file_path, boto3_session):
-    s3 = boto3_session.resource("s3")
 
+def _download_file(bucket, s3_path, local_file_path, s3client):
     local_file_path.parent.mkdir(parents=True, exist_ok=True)
 
-    s3_obj = s3.Object(bucket, s3_path)
-    s3_obj.download_file(str(local_file_path))
+    s3client.download_file(bucket, s3_path, str(local_file_path))
 
 
 def _create_sample_mapping(samples_list, output_path):
@@ -94,7 +95,7 @@ def _get_experiment_samples(experiment_id, aurora_client):
             FROM sample WHERE experiment_id = '{experiment_id}'
     """
 
-    return aurora_client.select(query)
+    return aurora_client.select(query, ttl=METADATA_CACHE_TTL)
 
 
 def _get_sample_files(sample_ids, aurora_client):
@@ -104,7 +105,7 @@ def _get_sample_files(sample_ids, aurora_client):
             WHERE sample_to_sample_file_map.sample_id IN ('{ "','".join(sample_ids) }')
     """
 
-    return aurora_client.select(query)
+    return aurora_client.select(query, ttl=METADATA_CACHE_TTL)
 
 
 def _get_samples(experiment_id, aurora_client):
@@ -146,7 +147,7 @@ def _download_samples(
     input_env,
     output_path,
     use_sample_id_as_name,
-    boto3_session,
+    s3client,
     aws_account_id,
     aurora_client,
 ):
@@ -178,9 +179,8 @@ def _download_samples(
 
             print(f"> Downloading {s3_path} (file {file_idx+1}/{num_files})")
 
-            s3client = boto3_session.client("s3")
             s3client.head_object(Bucket=bucket, Key=s3_path)
-            _download_file(bucket, s3_path, file_path, boto3_session)
+            _download_file(bucket, s3_path, file_path, s3client)
 
         print(f"Sample {sample_name} downloaded.\n")
 
@@ -214,7 +214,7 @@ def _download_raw_rds_files(
     output_path,
     use_sample_id_as_name,
     without_tunnel,
-    boto3_session,
+    s3client,
     aws_account_id,
     aurora_client,
 ):
@@ -225,7 +225,7 @@ def _download_raw_rds_files(
     # Download all the files prefixed with experiment_id, no added checks
     if without_tunnel:
         folder_path = output_path / "raw"
-        _download_folder(bucket, experiment_id, folder_path, boto3_session)
+        _download_folder(bucket, experiment_id, folder_path, s3client)
         print(end_message)
         return
 
@@ -246,9 +246,8 @@ def _download_raw_rds_files(
 
         print(f"Downloading {file_name} ({sample_idx+1}/{num_samples})")
 
-        s3client = boto3_session.client("s3")
         s3client.head_object(Bucket=bucket, Key=s3_path)
-        _download_file(bucket, s3_path, file_path, boto3_session)
+        _download_file(bucket, s3_path, file_path, s3client)
 
         print(f"Sample {sample['sample_name']} downloaded.\n")
 
@@ -259,7 +258,7 @@ def _download_processed_rds_file(
     experiment_id,
     input_env,
     output_path,
-    boto3_session,
+    s3client,
     aws_account_id,
 ):
     file_name = "processed_r.rds"
@@ -269,7 +268,7 @@ def _download_processed_rds_file(
     key = f"{experiment_id}/r.rds"
     file_path = output_path / file_name
 
-    _download_file(bucket, key, file_path, boto3_session)
+    _download_file(bucket, key, file_path, s3client)
 
     print(f"RDS file saved to {file_path}")
     click.echo(click.style(f"{end_message}", fg="green"))
@@ -279,14 +278,12 @@ def _download_filtered_cells(
     experiment_id,
     input_env,
     output_path,
-    boto3_session,
+    s3client,
     aws_account_id,
 ):
     bucket = f"{FILTERED_CELLS_BUCKET}-{input_env}-{aws_account_id}"
     end_message = "Filtered cells files have been downloaded."
 
-    s3client = boto3_session.client("s3")
-
     paginator = s3client.get_paginator("list_objects")
     operation_parameters = {"Bucket": bucket, "Prefix": experiment_id}
     page_iterator = paginator.paginate(**operation_parameters)
@@ -296,21 +293,19 @@ def _download_filtered_cells(
         for file in page["Contents"]:
             key = file["Key"]
             file_path = output_path / key.replace(experiment_id, "filtered-cells")
-            _download_file(bucket, key, file_path, boto3_session)
+            _download_file(bucket, key, file_path, s3client)
             print(f"RDS file saved to {file_path}")
 
     click.echo(click.style(f"{end_message}", fg="green"))
 
 
-def _download_cellsets(
-    experiment_id, input_env, output_path, boto3_session, aws_account_id
-):
+def _download_cellsets(experiment_id, input_env, output_path, s3client, aws_account_id):
     FILE_NAME = "cellsets.json"
 
     bucket = f"{CELLSETS_BUCKET}-{input_env}-{aws_account_id}"
     key = experiment_id
     file_path = output_path / FILE_NAME
-    _download_file(bucket, key, file_path, boto3_session)
+    _download_file(bucket, key, file_path, s3client)
     print(f"Cellsets file saved to {file_path}")
     click.echo(click.style("Cellsets file have been downloaded.", fg="green"))
 
@@ -379,6 +374,22 @@ def _download_cellsets(
         "processed RDS (-f processed_rds), and filtered cells (-f filtered_cells)."
     ),
 )
+@click.option(
+    "--no_cache",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Always query the database instead of using locally cached metadata.",
+)
+@click.option(
+    "--explain",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Print the timings and EXPLAIN (ANALYZE, BUFFERS) plans of the queries run.",
+)
 @click.option(
     "-p",
     "--aws_profile",
@@ -395,6 +406,8 @@ def download(
     all,
     name_with_id,
     without_tunnel,
+    no_cache,
+    explain,
     aws_profile,
 ):
     """
@@ -407,9 +420,11 @@ def download(
     -f samples -f cellsets -o output/folder
     """
 
-    boto3_session = boto3.Session(profile_name=aws_profile)
-    aws_account_id = boto3_session.client("sts").get_caller_identity().get("Account")
-    aws_region = boto3_session.region_name
+    cache = None if no_cache else Cache()
+
+    s3client = get_client("s3", aws_profile)
+    aws_account_id = get_account_id(aws_profile, cache)
+    aws_region = get_session(aws_profile).region_name
 
     # Set output path
     # By default add experiment_id to the output path
@@ -438,10 +453,16 @@ def download(
                 sample_mapping' and '--name_with_id'"
             )
     else:
+        # the tunnel is opened on the first query that isn't cached
         aurora_client = AuroraClient(
-            SANDBOX_ID, USER, aws_region, input_env, aws_profile
+            SANDBOX_ID,
+            USER,
+            aws_region,
+            input_env,
+            aws_profile,
+            cache=cache,
+            explain=explain,
         )
-        aurora_client.open_tunnel()
 
     for file in selected_files:
         if file == SAMPLES:
@@ -452,7 +473,7 @@ def download(
                     input_env,
                     output_path,
                     name_with_id,
-                    boto3_session,
+                    s3client,
                     aws_account_id,
                     aurora_client,
                 )
@@ -478,7 +499,7 @@ def download(
                 output_path,
                 name_with_id,
                 without_tunnel,
-                boto3_session,
+                s3client,
                 aws_account_id,
                 aurora_client,
             )
@@ -489,7 +510,7 @@ def download(
                 experiment_id,
                 input_env,
                 output_path,
-                boto3_session,
+                s3client,
                 aws_account_id,
             )
 
@@ -499,14 +520,14 @@ def download(
                 experiment_id,
                 input_env,
                 output_path,
-                boto3_session,
+                s3client,
                 aws_account_id,
             )
 
         elif file == CELLSETS:
             print("\n== Download cellsets file")
             _download_cellsets(
-                experiment_id, input_env, output_path, boto3_session, aws_account_id
+                experiment_id, input_env, output_path, s3client, aws_account_id
             )
 
         elif file == SAMPLE_MAPPING:
@@ -517,3 +538,6 @@ def download(
 
     if not without_tunnel:
         aurora_client.close_tunnel()
+
+        if explain:
+            aurora_client.print_query_report()
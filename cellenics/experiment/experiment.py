@@ -1,18 +1,32 @@
 import click
 
-from .download import download
-from .info import info
-from .upload import upload
+from ..utils.lazy_group import LazyGroup
 
+LAZY_SUBCOMMANDS = {
+    "download": (
+        "cellenics.experiment.download:download",
+        "Downloads files associated with an experiment from a given environment.",
+    ),
+    "info": (
+        "cellenics.experiment.info:info",
+        "Shows the required information related to the experiment.",
+    ),
+    "upload": (
+        "cellenics.experiment.upload:upload",
+        "Uploads the files in input_path into the specified experiment_id and "
+        "environment.",
+    ),
+    "usage": (
+        "cellenics.experiment.usage:usage",
+        "Shows how many objects and bytes experiments take in each S3 bucket, "
+        "sorted from the heaviest experiment.",
+    ),
+}
 
-@click.group()
+
+@click.group(cls=LazyGroup, lazy_subcommands=LAZY_SUBCOMMANDS)
 def experiment():
     """
     Manage Cellenics experiment data and settings.
     """
     pass
-
-
-experiment.add_command(download)
-experiment.add_command(upload)
-experiment.add_command(info)
@@ -1,12 +1,18 @@
+import asyncio
 import json
-import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
-import boto3
 import click
 from tabulate import tabulate
 
-from ..utils.AuroraClient import AuroraClient
-from ..utils.constants import DEFAULT_AWS_PROFILE
+from ..utils.AsyncAuroraClient import AsyncAuroraClient
+from ..utils.AuroraClient import to_sql_array
+from ..utils.aws import get_client
+from ..utils.cache import Cache
+from ..utils.cognito import get_user_pool_id, get_users_attributes
+from ..utils.constants import DEFAULT_AWS_PROFILE, METADATA_CACHE_TTL
+from ..utils.throttling import retry_throttled
 
 SAMPLES = "samples"
 RAW_FILE = "raw_rds"
@@ -19,76 +25,327 @@ SANDBOX_ID = "default"
 REGION = "us-east-1"
 USER = "dev_role"
 
+# experiments fetched together with a single query per table in bulk mode
+BULK_BATCH_SIZE = 200
 
-def _get_experiment_info(aurora_client, experiment_id):
-    query = f"""
-        SELECT id as experiment_id, name as experiment_name, created_at, \
-            pod_cpus, pod_memory FROM experiment WHERE id = '{experiment_id}'
-    """
-    return aurora_client.select(query)[0]
+# concurrent step functions requests when fetching the live status of runs
+LIVE_STATUS_WORKERS = 8
+
+EXECUTION_END_EVENTS = ["ExecutionFailed", "ExecutionAborted", "ExecutionTimedOut"]
 
 
 def _get_user_cognito_info(
     users,
     env,
+    cache=None,
+    aws_profile=None,
     attributes=["name", "email", "custom:agreed_terms", "custom:agreed_emails"],
 ):
-    cognito = boto3.client("cognito-idp")
+    cognito = get_client("cognito-idp", aws_profile)
 
-    userpools = cognito.list_user_pools(MaxResults=60)["UserPools"]
+    userpool_id = get_user_pool_id(env, aws_profile, cache)
 
-    userpool = [
-        pool for pool in userpools if re.match(f"biomage-.*-{env}", pool["Name"])
-    ][0]
+    users_attributes = get_users_attributes(
+        cognito, userpool_id, [user["user_id"] for user in users], cache
+    )
 
     for user in users:
-        u = cognito.admin_get_user(UserPoolId=userpool["Id"], Username=user["user_id"])
-
-        for attr in u["UserAttributes"]:
-            if attr["Name"] in attributes:
-                user[attr["Name"]] = attr["Value"]
+        for name, value in users_attributes[user["user_id"]].items():
+            if name in attributes:
+                user[name] = value
 
     return users
 
 
-def _get_experiment_users(aurora_client, experiment_id, env):
+async def _get_experiment(aurora_client, experiment_id, env):
+    """
+    Fetches the info, users, runs and samples of the experiment in a single
+    round trip, assembling the document in the database.
+    """
+    # not cached: the document includes users and runs, which change too often
     query = f"""
-        SELECT user_id, access_role \
-            FROM user_access WHERE experiment_id = '{experiment_id}'
+        SELECT json_build_object(
+            'info', (
+                SELECT row_to_json(i) FROM (
+                    SELECT id as experiment_id, name as experiment_name, \
+                        created_at, pod_cpus, pod_memory \
+                    FROM experiment WHERE id = '{experiment_id}'
+                ) i
+            ),
+            'users', (
+                SELECT COALESCE(json_agg(u), '[]'::json) FROM (
+                    SELECT user_id, access_role \
+                    FROM user_access WHERE experiment_id = '{experiment_id}'
+                ) u
+            ),
+            'runs', (
+                SELECT COALESCE(json_agg(r), '[]'::json) FROM (
+                    SELECT pipeline_type, state_machine_arn, execution_arn, \
+                        last_status_response \
+                    FROM experiment_execution WHERE experiment_id = '{experiment_id}'
+                ) r
+            ),
+            'samples', (
+                SELECT COALESCE(json_agg(s), '[]'::json) FROM (
+                    SELECT id as sample_id, name, sample_technology, options \
+                    FROM sample WHERE experiment_id = '{experiment_id}'
+                ) s
+            )
+        ) AS document
     """
 
-    try:
-        users = aurora_client.select(query)
-        return _get_user_cognito_info(users, env)
-    except Exception as e:
-        print(e)
-        return []
+    result = (await aurora_client.select(query))[0]["document"]
 
+    if result["users"]:
+        loop = asyncio.get_running_loop()
 
-def _get_experiment_samples(aurora_client, experiment_id):
-    query = f"""
-        SELECT id as sample_id, name, sample_technology, options \
-            FROM sample WHERE experiment_id = '{experiment_id}'
+        try:
+            await loop.run_in_executor(
+                None,
+                _get_user_cognito_info,
+                result["users"],
+                env,
+                aurora_client.cache,
+                aurora_client.aws_profile,
+            )
+        except Exception as e:
+            print(e, file=sys.stderr)
+            result["users"] = []
+
+    return result
+
+
+def _group_by_experiment(rows):
+    grouped = {}
+
+    for row in rows:
+        grouped.setdefault(row.pop("experiment_id"), []).append(row)
+
+    return grouped
+
+
+async def _get_experiments_bulk(aurora_client, experiment_ids, env):
+    """
+    Fetches the info, users, samples and runs of many experiments with a single
+    query per table, returning one document per experiment in the given order.
     """
+    ids = to_sql_array(experiment_ids)
+
+    infos, users, samples, runs = await aurora_client.gather(
+        aurora_client.select_or_empty(
+            f"""SELECT id as experiment_id, name as experiment_name, created_at, \
+                pod_cpus, pod_memory FROM experiment WHERE id = ANY({ids})""",
+        ),
+        aurora_client.select_or_empty(
+            f"""SELECT experiment_id, user_id, access_role \
+                FROM user_access WHERE experiment_id = ANY({ids})""",
+        ),
+        aurora_client.select_or_empty(
+            f"""SELECT experiment_id, id as sample_id, name, sample_technology, \
+                options FROM sample WHERE experiment_id = ANY({ids})""",
+            ttl=METADATA_CACHE_TTL,
+        ),
+        aurora_client.select_or_empty(
+            f"""SELECT experiment_id, pipeline_type, state_machine_arn, execution_arn, \
+                last_status_response FROM experiment_execution \
+                WHERE experiment_id = ANY({ids})""",
+        ),
+    )
+
+    if users:
+        loop = asyncio.get_running_loop()
+
+        try:
+            await loop.run_in_executor(
+                None,
+                _get_user_cognito_info,
+                users,
+                env,
+                aurora_client.cache,
+                aurora_client.aws_profile,
+            )
+        except Exception as e:
+            print(e, file=sys.stderr)
+
+    infos = {info["experiment_id"]: info for info in infos}
+    users = _group_by_experiment(users)
+    samples = _group_by_experiment(samples)
+    runs = _group_by_experiment(runs)
+
+    return [
+        {
+            "experiment_id": experiment_id,
+            "info": infos.get(experiment_id),
+            "users": users.get(experiment_id, []),
+            "runs": runs.get(experiment_id, []),
+            "samples": samples.get(experiment_id, []),
+        }
+        for experiment_id in experiment_ids
+    ]
+
+
+def read_experiment_ids(experiment_ids, ids_file):
+    experiment_ids = list(experiment_ids)
+
+    if ids_file:
+        with open(ids_file) as f:
+            experiment_ids += [line.strip() for line in f if line.strip()]
+
+    if not experiment_ids:
+        raise Exception("Provide at least one experiment id with -e or --ids_file")
+
+    # drop duplicates, keeping the order
+    return list(dict.fromkeys(experiment_ids))
+
+
+def _get_step_durations(events):
+    """
+    Computes how long each state of the execution took from its history events.
+    States entered several times (e.g. inside a map) add up their durations.
+    """
+    steps = {}
+    entered = {}
 
-    try:
-        return aurora_client.select(query)
-    except Exception as e:
-        print(e)
-        return []
+    for event in events:
+        if event["type"].endswith("StateEntered"):
+            name = event["stateEnteredEventDetails"]["name"]
+            entered.setdefault(name, []).append(event["timestamp"])
+            steps.setdefault(name, {"name": name, "seconds": 0, "status": "RUNNING"})
 
+        elif event["type"].endswith("StateExited"):
+            name = event["stateExitedEventDetails"]["name"]
+            if not entered.get(name):
+                continue
 
-def _get_experiment_runs(aurora_client, experiment_id):
-    query = f"""
-        SELECT pipeline_type, state_machine_arn, execution_arn, last_status_response \
-            FROM experiment_execution WHERE experiment_id = '{experiment_id}'
+            start = entered[name].pop(0)
+            steps[name]["seconds"] += (event["timestamp"] - start).total_seconds()
+
+            if not entered[name]:
+                steps[name]["status"] = "SUCCEEDED"
+
+        elif event["type"] in EXECUTION_END_EVENTS:
+            # the states still running when the execution stopped
+            for name, pending in entered.items():
+                for start in pending:
+                    steps[name]["seconds"] += (
+                        event["timestamp"] - start
+                    ).total_seconds()
+                    steps[name]["status"] = "FAILED"
+
+    return list(steps.values())
+
+
+@retry_throttled
+def _describe_execution(sfn, execution_arn):
+    return sfn.describe_execution(executionArn=execution_arn)
+
+
+@retry_throttled
+def _get_execution_history_page(sfn, execution_arn, next_token=None):
+    kwargs = {"executionArn": execution_arn, "maxResults": 1000}
+    if next_token:
+        kwargs["nextToken"] = next_token
+
+    return sfn.get_execution_history(**kwargs)
+
+
+def _get_execution_history(sfn, execution_arn):
+    events = []
+    next_token = None
+
+    while True:
+        page = _get_execution_history_page(sfn, execution_arn, next_token)
+        events += page["events"]
+        next_token = page.get("nextToken")
+
+        if not next_token:
+            return events
+
+
+def _get_live_status(sfn, execution_arn):
+    execution = _describe_execution(sfn, execution_arn)
+    events = _get_execution_history(sfn, execution_arn)
+
+    stop_date = execution.get("stopDate")
+
+    return {
+        "status": execution["status"],
+        "startDate": execution["startDate"].isoformat(),
+        "stopDate": stop_date.isoformat() if stop_date else None,
+        "steps": _get_step_durations(events),
+    }
+
+
+def _add_live_status(documents, aws_profile):
+    """
+    Adds the current status of every run in the documents, as reported by
+    step functions, fetching all of them concurrently.
+    """
+    runs = [
+        run
+        for document in documents
+        for run in document["runs"]
+        if run.get("execution_arn")
+    ]
+
+    def fetch(run):
+        # executions live in the region of their state machine
+        region = run["execution_arn"].split(":")[3]
+        client = get_client("stepfunctions", aws_profile, region)
+
+        try:
+            return _get_live_status(client, run["execution_arn"])
+        except Exception as e:
+            return {"error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=LIVE_STATUS_WORKERS) as executor:
+        for run, live_status in zip(runs, executor.map(fetch, runs)):
+            run["live_status"] = live_status
+
+
+def _write_json(document, output=sys.stdout):
+    """
+    Writes the document as indented JSON one section at a time, encoding
+    each section iteratively and dropping it once written.
+    """
+    encoder = json.JSONEncoder(indent=4)
+    separator = "{"
+
+    for key in list(document):
+        section = document.pop(key)
+
+        output.write(f"{separator}\n    {json.dumps(key)}: ")
+        separator = ","
+
+        # json strings never contain raw newlines, so this only nests the indent
+        for chunk in encoder.iterencode(section):
+            output.write(chunk.replace("\n", "\n    "))
+
+        output.flush()
+
+    output.write("{}\n" if separator == "{" else "\n}\n")
+    output.flush()
+
+
+def _write_ndjson(experiment_id, document, output=sys.stdout):
+    """
+    Writes the document as flat NDJSON: one line for the info and one line for
+    each user, run and sample, tagged with their section.
     """
+    if document["info"]:
+        output.write(json.dumps({"section": "info", **document["info"]}) + "\n")
+
+    for section, key in [("users", "user"), ("runs", "run"), ("samples", "sample")]:
+        for record in document.pop(section):
+            record = {"section": key, "experiment_id": experiment_id, **record}
+            output.write(json.dumps(record) + "\n")
+
+    output.flush()
 
-    try:
-        return aurora_client.select(query)
-    except Exception as e:
-        print(e)
-        return []
+
+def _warn_if_missing(experiment_id, document):
+    if document["info"] is None:
+        print(f"Experiment {experiment_id} not found", file=sys.stderr)
 
 
 def _print_tabbed(key, value):
@@ -135,8 +392,16 @@ def _format_runs(content):
 @click.option(
     "-e",
     "--experiment_id",
-    required=True,
-    help="Experiment ID to be copied.",
+    "experiment_ids",
+    multiple=True,
+    required=False,
+    help="Experiment ID to show, can be given multiple times.",
+)
+@click.option(
+    "--ids_file",
+    required=False,
+    default=None,
+    help="File with one experiment ID per line to show.",
 )
 @click.option(
     "-i",
@@ -145,6 +410,38 @@ def _format_runs(content):
     default="production",
     help="Input environment to pull the data from.",
 )
+@click.option(
+    "--live",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Add the current status and step durations of the runs from step functions.",
+)
+@click.option(
+    "--ndjson",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Print one JSON line per info, user, run and sample instead of documents.",
+)
+@click.option(
+    "--no_cache",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Always query the database instead of using locally cached metadata.",
+)
+@click.option(
+    "--explain",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Print the timings and EXPLAIN (ANALYZE, BUFFERS) plans of the queries run.",
+)
 @click.option(
     "-p",
     "--aws_profile",
@@ -153,24 +450,65 @@ def _format_runs(content):
     show_default=True,
     help="The name of the profile stored in ~/.aws/credentials to use.",
 )
-def info(experiment_id, input_env, aws_profile):
+def info(
+    experiment_ids, ids_file, input_env, live, ndjson, no_cache, explain, aws_profile
+):
     """
     Shows the required information related to the experiment.
+    When several experiments are given, one JSON document per experiment, with
+    its experiment_id, is printed per line (NDJSON). Experiments that don't exist
+    are reported in stderr. With --ndjson every info, user, run and sample
+    is printed in its own line instead.
     It requires an open tunnel to the desired environment to fetch data from SQL:
     `cellenics rds tunnel -i production`
 
     E.g.:
     cellenics experiment info -e 2093e95fd17372fb558b81b9142f230e -i production
+    cellenics experiment info --ids_file cohort.txt -i production > cohort.ndjson
     """
 
-    with AuroraClient(
-        SANDBOX_ID, USER, REGION, input_env, aws_profile
-    ) as aurora_client:
-        info = _get_experiment_info(aurora_client, experiment_id)
-        users = _get_experiment_users(aurora_client, experiment_id, input_env)
-        samples = _get_experiment_samples(aurora_client, experiment_id)
-        runs = _get_experiment_runs(aurora_client, experiment_id)
+    experiment_ids = read_experiment_ids(experiment_ids, ids_file)
 
-    result = {"info": info, "users": users, "runs": runs, "samples": samples}
-
-    print(json.dumps(result, indent=4))
+    with AsyncAuroraClient(
+        SANDBOX_ID,
+        USER,
+        REGION,
+        input_env,
+        aws_profile,
+        cache=None if no_cache else Cache(),
+        explain=explain,
+    ) as aurora_client:
+        if len(experiment_ids) == 1:
+            result = asyncio.run(
+                _get_experiment(aurora_client, experiment_ids[0], input_env)
+            )
+
+            if live:
+                _add_live_status([result], aws_profile)
+
+            _warn_if_missing(experiment_ids[0], result)
+
+            if ndjson:
+                _write_ndjson(experiment_ids[0], result)
+            else:
+                _write_json(result)
+        else:
+            for i in range(0, len(experiment_ids), BULK_BATCH_SIZE):
+                batch = experiment_ids[i : i + BULK_BATCH_SIZE]
+                documents = asyncio.run(
+                    _get_experiments_bulk(aurora_client, batch, input_env)
+                )
+
+                if live:
+                    _add_live_status(documents, aws_profile)
+
+                for experiment_id, document in zip(batch, documents):
+                    _warn_if_missing(experiment_id, document)
+
+                    if ndjson:
+                        _write_ndjson(experiment_id, document)
+                    else:
+                        print(json.dumps(document), flush=True)
+
+    if explain:
+        aurora_client.print_query_report()
@@ -1,10 +1,11 @@
 import os
 from pathlib import Path
 
-import boto3
 import click
 
 from ..utils.AuroraClient import AuroraClient
+from ..utils.aws import get_account_id, get_client
+from ..utils.cache import Cache
 from ..utils.constants import (
     CELLSETS_BUCKET,
     DEFAULT_AWS_PROFILE,
@@ -32,11 +33,9 @@ file_type_to_name_map = {
 DATA_LOCATION = os.getenv("CELLENICS_DATA_PATH", "./data")
 
 
-def _upload_file(bucket, s3_path, file_path, boto3_session):
-    s3 = boto3_session.resource("s3")
-
+def _upload_file(bucket, s3_path, file_path, s3client):
     print(f"{file_path}, {bucket}, {s3_path}")
-    s3.meta.client.upload_file(str(file_path), bucket, s3_path)
+    s3client.upload_file(str(file_path), bucket, s3_path)
 
 
 def _get_experiment_samples(experiment_id, aurora_client):
@@ -45,6 +44,7 @@ def _get_experiment_samples(experiment_id, aurora_client):
             FROM sample WHERE experiment_id = '{experiment_id}'
     """
 
+    # the samples decide which keys get overwritten, never read them from the cache
     return aurora_client.select(query)
 
 
@@ -53,9 +53,10 @@ def _upload_raw_rds_files(
     output_env,
     input_path,
     without_tunnel,
-    boto3_session,
+    s3client,
     aws_account_id,
     aws_profile,
+    explain,
 ):
     bucket = f"{RAW_FILES_BUCKET}-{output_env}-{aws_account_id}"
     local_folder_path = os.path.join(input_path, f"{experiment_id}/raw")
@@ -76,16 +77,24 @@ def _upload_raw_rds_files(
                 s3_path = f"{experiment_id}/{sample_id}/r.rds"
 
                 print(f"\t= Uploading {local_path} to {s3_path}")
-                _upload_file(bucket, s3_path, local_path, boto3_session)
+                _upload_file(bucket, s3_path, local_path, s3client)
         print(end_message)
 
         return
 
     with AuroraClient(
-        SANDBOX_ID, USER, REGION, output_env, aws_profile
+        SANDBOX_ID,
+        USER,
+        REGION,
+        output_env,
+        aws_profile,
+        explain=explain,
     ) as aurora_client:
         sample_list = _get_experiment_samples(experiment_id, aurora_client)
 
+    if explain:
+        aurora_client.print_query_report()
+
     num_samples = len(sample_list)
 
     print(f"\n{num_samples} samples found. Uploading raw rds files...\n")
@@ -100,7 +109,7 @@ def _upload_raw_rds_files(
 
         print(f"uploading {sample_name} ({sample_idx+1}/{num_samples})")
 
-        _upload_file(bucket, s3_path, file_path, boto3_session)
+        _upload_file(bucket, s3_path, file_path, s3client)
 
         print(f"Sample {sample_name} uploaded.\n")
 
@@ -111,7 +120,7 @@ def _upload_processed_rds_file(
     experiment_id,
     output_env,
     input_path,
-    boto3_session,
+    s3client,
     aws_account_id,
 ):
     file_name = "processed_r.rds"
@@ -121,21 +130,19 @@ def _upload_processed_rds_file(
     key = f"{experiment_id}/r.rds"
     file_path = input_path / file_name
 
-    _upload_file(bucket, key, file_path, boto3_session)
+    _upload_file(bucket, key, file_path, s3client)
 
     print(f"RDS file saved to {file_path}")
     click.echo(click.style(f"{end_message}", fg="green"))
 
 
-def _upload_cellsets(
-    experiment_id, output_env, input_path, boto3_session, aws_account_id
-):
+def _upload_cellsets(experiment_id, output_env, input_path, s3client, aws_account_id):
     FILE_NAME = "cellsets.json"
 
     bucket = f"{CELLSETS_BUCKET}-{output_env}-{aws_account_id}"
     key = experiment_id
     file_path = input_path / FILE_NAME
-    _upload_file(bucket, key, file_path, boto3_session)
+    _upload_file(bucket, key, file_path, s3client)
     click.echo(
         click.style(f"Cellsets file have been uploaded to {experiment_id}.", fg="green")
     )
@@ -195,6 +202,22 @@ def _upload_cellsets(
         "If set, the raw samples must be stored by sample id instead of sample name"
     ),
 )
+@click.option(
+    "--no_cache",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Always ask AWS for the account id instead of using the cached one.",
+)
+@click.option(
+    "--explain",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Print the timings and EXPLAIN (ANALYZE, BUFFERS) plans of the queries run.",
+)
 @click.option(
     "-p",
     "--aws_profile",
@@ -204,7 +227,15 @@ def _upload_cellsets(
     help="The name of the profile stored in ~/.aws/credentials to use.",
 )
 def upload(
-    experiment_id, output_env, input_path, files, all, without_tunnel, aws_profile
+    experiment_id,
+    output_env,
+    input_path,
+    files,
+    all,
+    without_tunnel,
+    no_cache,
+    explain,
+    aws_profile,
 ):
     """
     Uploads the files in input_path into the specified experiment_id and environment.\n
@@ -216,8 +247,8 @@ def upload(
     -f samples -f cellsets -o output/folder
     """
 
-    boto3_session = boto3.Session(profile_name=aws_profile)
-    aws_account_id = boto3_session.client("sts").get_caller_identity().get("Account")
+    s3client = get_client("s3", aws_profile)
+    aws_account_id = get_account_id(aws_profile, None if no_cache else Cache())
 
     # Set output path
     # By default add experiment_id to the output path
@@ -246,9 +277,10 @@ def upload(
                 output_env,
                 input_path,
                 without_tunnel,
-                boto3_session,
+                s3client,
                 aws_account_id,
                 aws_profile,
+                explain,
             )
 
         elif file == PROCESSED_FILE:
@@ -257,14 +289,14 @@ def upload(
                 experiment_id,
                 output_env,
                 input_path,
-                boto3_session,
+                s3client,
                 aws_account_id,
             )
 
         elif file == CELLSETS:
             print("\n== upload cellsets file")
             _upload_cellsets(
-                experiment_id, output_env, input_path, boto3_session, aws_account_id
+                experiment_id, output_env, input_path, s3client, aws_account_id
             )
         else:
             print(f"\n== Unknown file option {file}")
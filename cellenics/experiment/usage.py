@@ -0,0 +1,228 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from botocore.exceptions import ClientError
+from tabulate import tabulate
+
+from ..utils.AuroraClient import AuroraClient, to_sql_array
+from ..utils.aws import get_account_id, get_client
+from ..utils.cache import Cache
+from ..utils.constants import (
+    CELLSETS_BUCKET,
+    DEFAULT_AWS_PROFILE,
+    FILTERED_CELLS_BUCKET,
+    PROCESSED_FILES_BUCKET,
+    PRODUCTION,
+    RAW_FILES_BUCKET,
+    SAMPLES_BUCKET,
+)
+from .info import read_experiment_ids
+
+BUCKETS = {
+    "samples": SAMPLES_BUCKET,
+    "raw_rds": RAW_FILES_BUCKET,
+    "processed_rds": PROCESSED_FILES_BUCKET,
+    "filtered_cells": FILTERED_CELLS_BUCKET,
+    "cellsets": CELLSETS_BUCKET,
+}
+
+# concurrent listings, each one pages through a single experiment prefix or
+# looks up a single sample file
+MAX_WORKERS = 16
+
+SANDBOX_ID = "default"
+REGION = "us-east-1"
+USER = "dev_role"
+
+
+def _format_size(size):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+    return f"{size:.1f} TB"
+
+
+def _get_prefix_usage(s3client, bucket, prefix):
+    """
+    Returns the number of objects and total bytes stored under the prefix.
+    """
+    count = 0
+    size = 0
+
+    paginator = s3client.get_paginator("list_objects_v2")
+
+    try:
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for s3_object in page.get("Contents", []):
+                count += 1
+                size += s3_object["Size"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchBucket":
+            raise e
+
+    return count, size
+
+
+def _get_sample_file_size(s3client, bucket, key):
+    try:
+        return s3client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ["404", "NoSuchBucket"]:
+            raise e
+
+        return None
+
+
+def _get_sample_files(experiment_ids, input_env, aws_profile):
+    """
+    Returns a dict of experiment id to the s3 paths of its sample files. Sample
+    files aren't stored under the experiment id and can be shared by clones.
+    """
+    query = f"""
+        SELECT DISTINCT sample.experiment_id, sample_file.s3_path FROM sample \
+            INNER JOIN sample_to_sample_file_map \
+            ON sample_to_sample_file_map.sample_id = sample.id \
+            INNER JOIN sample_file \
+            ON sample_file.id = sample_to_sample_file_map.sample_file_id \
+            WHERE sample.experiment_id = ANY({to_sql_array(experiment_ids)})
+    """
+
+    with AuroraClient(SANDBOX_ID, USER, REGION, input_env, aws_profile) as client:
+        rows = client.select_or_empty(query)
+
+    sample_files = {experiment_id: [] for experiment_id in experiment_ids}
+
+    for row in rows:
+        sample_files[row["experiment_id"]].append(row["s3_path"])
+
+    return sample_files
+
+
+def _get_usage(experiment_ids, input_env, aws_profile, aws_account_id):
+    """
+    Sizes the sample files of every experiment and lists its prefix in every
+    other bucket concurrently.
+    Returns a dict of experiment id to {bucket name: (objects, bytes)}.
+    """
+    s3client = get_client("s3", aws_profile)
+
+    sample_files = _get_sample_files(experiment_ids, input_env, aws_profile)
+    samples_bucket = f"{SAMPLES_BUCKET}-{input_env}-{aws_account_id}"
+
+    listings = [
+        (experiment_id, name, f"{bucket}-{input_env}-{aws_account_id}")
+        for experiment_id in experiment_ids
+        for name, bucket in BUCKETS.items()
+        if bucket != SAMPLES_BUCKET
+    ]
+
+    def list_prefix(listing):
+        experiment_id, _, bucket = listing
+        return _get_prefix_usage(s3client, bucket, experiment_id)
+
+    def get_size(key):
+        return _get_sample_file_size(s3client, samples_bucket, key)
+
+    usage = {experiment_id: {} for experiment_id in experiment_ids}
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        keys = list({key for keys in sample_files.values() for key in keys})
+        sizes = dict(zip(keys, executor.map(get_size, keys)))
+
+        for (experiment_id, name, _), result in zip(
+            listings, executor.map(list_prefix, listings)
+        ):
+            usage[experiment_id][name] = result
+
+    for experiment_id, keys in sample_files.items():
+        found = [sizes[key] for key in keys if sizes[key] is not None]
+        usage[experiment_id]["samples"] = (len(found), sum(found))
+
+    return usage
+
+
+def _print_usage(usage, top):
+    rows = []
+
+    for experiment_id, buckets in usage.items():
+        objects = sum(count for count, _ in buckets.values())
+        total = sum(size for _, size in buckets.values())
+
+        rows.append(
+            [experiment_id]
+            + [_format_size(buckets[name][1]) for name in BUCKETS]
+            + [objects, total]
+        )
+
+    # heaviest experiments first
+    rows.sort(key=lambda row: row[-1], reverse=True)
+
+    if top:
+        rows = rows[:top]
+
+    for row in rows:
+        row[-1] = _format_size(row[-1])
+
+    header = ["experiment_id"] + list(BUCKETS) + ["objects", "total"]
+    print(tabulate(rows, header, tablefmt="simple"))
+
+
+@click.command()
+@click.option(
+    "-e",
+    "--experiment_id",
+    "experiment_ids",
+    multiple=True,
+    required=False,
+    help="Experiment ID to measure, can be given multiple times.",
+)
+@click.option(
+    "--ids_file",
+    required=False,
+    default=None,
+    help="File with one experiment ID per line to measure.",
+)
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=PRODUCTION,
+    show_default=True,
+    help="Input environment to measure the data in.",
+)
+@click.option(
+    "--top",
+    required=False,
+    default=None,
+    type=int,
+    help="Only show this many of the heaviest experiments.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+def usage(experiment_ids, ids_file, input_env, top, aws_profile):
+    """
+    Shows how many objects and bytes experiments take in each S3 bucket,
+    sorted from the heaviest experiment. Sample files are found through the
+    database, so it requires an open tunnel to the environment:
+    `cellenics rds tunnel -i production`
+
+    E.g.:
+    cellenics experiment usage -e 2093e95fd17372fb558b81b9142f230e -i production
+    cellenics experiment usage --ids_file cohort.txt --top 20
+    """
+
+    experiment_ids = read_experiment_ids(experiment_ids, ids_file)
+
+    aws_account_id = get_account_id(aws_profile, Cache())
+
+    _print_usage(
+        _get_usage(experiment_ids, input_env, aws_profile, aws_account_id), top
+    )
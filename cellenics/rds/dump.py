@@ -0,0 +1,135 @@
+import shlex
+
+import click
+
+from ..utils.AuroraClient import AuroraClient
+from ..utils.constants import DEFAULT_AWS_PROFILE, STAGING
+
+DEFAULT_JOBS = 4
+DEFAULT_COMPRESSION = 6
+
+
+def _build_dump_command(output_path, jobs, compression, tables, exclude_tables):
+    command = [
+        "pg_dump",
+        "--format=directory",
+        f"--jobs={jobs}",
+        f"--compress={compression}",
+        f"--file={output_path}",
+    ]
+    command += [f"--table={table}" for table in tables]
+    command += [f"--exclude-table={table}" for table in exclude_tables]
+
+    return " ".join(shlex.quote(arg) for arg in command)
+
+
+@click.command()
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=STAGING,
+    show_default=True,
+    help="Input environment of the RDS server.",
+)
+@click.option(
+    "-s",
+    "--sandbox_id",
+    required=False,
+    default="default",
+    show_default=True,
+    help="Default sandbox id.",
+)
+@click.option(
+    "-u",
+    "--user",
+    required=False,
+    default="dev_role",
+    show_default=True,
+    help="User to connect as (role is the same as user).",
+)
+@click.option(
+    "-r",
+    "--region",
+    required=False,
+    default="eu-west-1",
+    show_default=True,
+    help="Region the RDS server is in.",
+)
+@click.option(
+    "-o",
+    "--output_path",
+    required=True,
+    help="Directory to write the dump to, it must not exist.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    required=False,
+    default=DEFAULT_JOBS,
+    show_default=True,
+    type=int,
+    help="Number of tables dumped in parallel.",
+)
+@click.option(
+    "-Z",
+    "--compression",
+    required=False,
+    default=DEFAULT_COMPRESSION,
+    show_default=True,
+    type=click.IntRange(0, 9),
+    help="Compression level of the dumped files.",
+)
+@click.option(
+    "-t",
+    "--table",
+    "tables",
+    multiple=True,
+    required=False,
+    help="Only dump this table (pattern), can be given multiple times.",
+)
+@click.option(
+    "-T",
+    "--exclude_table",
+    "exclude_tables",
+    multiple=True,
+    required=False,
+    help="Do not dump this table (pattern), can be given multiple times.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+def dump(
+    input_env,
+    sandbox_id,
+    user,
+    region,
+    output_path,
+    jobs,
+    compression,
+    tables,
+    exclude_tables,
+    aws_profile,
+):
+    """
+    Dumps the database into a directory, dumping several tables in parallel.
+    The dump can be loaded with `cellenics rds restore`.\n
+
+    Examples.:\n
+        cellenics rds dump -o dump/\n
+        cellenics rds dump -i production -j 8 -T 'plot' -o dump/
+    """
+
+    command = _build_dump_command(
+        output_path, jobs, compression, tables, exclude_tables
+    )
+
+    with AuroraClient(sandbox_id, user, region, input_env, aws_profile) as client:
+        client.run_query(command, capture_output=False, verbose=True)
+
+    click.echo(click.style(f"Database dumped to {output_path}.", fg="green"))
@@ -0,0 +1,248 @@
+import gzip
+import io
+import os
+import sys
+
+import click
+
+from ..utils.AuroraClient import AuroraClient
+from ..utils.constants import DEFAULT_AWS_PROFILE, STAGING
+
+CSV = "csv"
+PARQUET = "parquet"
+
+GZIP = "gzip"
+ZSTD = "zstd"
+NO_COMPRESSION = "none"
+
+
+class _ChunksReader(io.RawIOBase):
+    """
+    Read-only file object over an iterator of byte chunks.
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            self._buffer = next(self._chunks, b"")
+            if not self._buffer:
+                return 0
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+
+        return size
+
+
+class _Progress:
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+
+    def update(self, rows, size):
+        self.rows += rows
+        self.bytes += size
+        print(
+            f"\rExported {self.rows} rows, {self.bytes} bytes", end="", file=sys.stderr
+        )
+
+    def done(self):
+        print(file=sys.stderr)
+
+
+def _open_compressed(output_path, compression):
+    if compression == GZIP:
+        return gzip.open(output_path, "wb")
+
+    if compression == ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception(
+                "zstd compression requires the zstandard package, install it with "
+                '"pip install cellenics-utils[export]"'
+            )
+
+        return zstandard.ZstdCompressor().stream_writer(open(output_path, "wb"))
+
+    return open(output_path, "wb")
+
+
+def _export_csv(chunks, output_path, compression, progress):
+    header_pending = True
+
+    try:
+        with _open_compressed(output_path, compression) as output:
+            for chunk in chunks:
+                rows = chunk.count(b"\n")
+
+                # don't count the header as a row
+                if header_pending and rows:
+                    rows -= 1
+                    header_pending = False
+
+                output.write(chunk)
+                progress.update(rows, len(chunk))
+    except BaseException:
+        # a truncated file would still decompress and look valid
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def _export_parquet(chunks, output_path, compression, progress):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from pyarrow import csv
+    except ImportError:
+        raise Exception(
+            "parquet export requires the pyarrow package, install it with "
+            '"pip install cellenics-utils[export]"'
+        )
+
+    # wrap the stream to count the bytes coming from the database
+    def counted():
+        for chunk in chunks:
+            progress.update(0, len(chunk))
+            yield chunk
+
+    raw = io.BufferedReader(_ChunksReader(counted()))
+
+    # types inferred from the first block might not fit later rows (e.g. a column
+    # that is null at first), so every column is exported as a string
+    names = csv.read_csv(io.BytesIO(raw.readline())).column_names
+    schema = pa.schema([(name, pa.string()) for name in names])
+
+    writer = pq.ParquetWriter(output_path, schema, compression=compression)
+
+    try:
+        # pyarrow refuses to open a stream without rows
+        if raw.peek(1):
+            reader = csv.open_csv(
+                raw,
+                read_options=csv.ReadOptions(column_names=names),
+                convert_options=csv.ConvertOptions(
+                    column_types=schema, strings_can_be_null=True
+                ),
+            )
+
+            # each batch read from the stream is written as its own row group
+            for batch in reader:
+                writer.write_batch(batch)
+                progress.update(batch.num_rows, 0)
+    except BaseException:
+        # don't leave a partial file behind
+        writer.close()
+        os.remove(output_path)
+        raise
+
+    writer.close()
+
+
+@click.command()
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=STAGING,
+    show_default=True,
+    help="Input environment of the RDS server.",
+)
+@click.option(
+    "-s",
+    "--sandbox_id",
+    required=False,
+    default="default",
+    show_default=True,
+    help="Default sandbox id.",
+)
+@click.option(
+    "-u",
+    "--user",
+    required=False,
+    default="dev_role",
+    show_default=True,
+    help="User to connect as (role is the same as user).",
+)
+@click.option(
+    "-r",
+    "--region",
+    required=False,
+    default="eu-west-1",
+    show_default=True,
+    help="Region the RDS server is in.",
+)
+@click.option(
+    "-o",
+    "--output_path",
+    required=True,
+    help="File to write the results to.",
+)
+@click.option(
+    "-f",
+    "--format",
+    "output_format",
+    required=False,
+    default=CSV,
+    show_default=True,
+    type=click.Choice([CSV, PARQUET]),
+    help="Format of the output file.",
+)
+@click.option(
+    "-c",
+    "--compression",
+    required=False,
+    default=GZIP,
+    show_default=True,
+    type=click.Choice([GZIP, ZSTD, NO_COMPRESSION]),
+    help="Compression of the csv file, or codec of the parquet file.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+@click.argument("query")
+def export(
+    query,
+    input_env,
+    sandbox_id,
+    user,
+    region,
+    output_path,
+    output_format,
+    compression,
+    aws_profile,
+):
+    """
+    Exports the results of a query to a compressed csv or parquet file.
+    Results are streamed from the database, so they are never held in memory.\n
+
+    Examples.:\n
+        cellenics rds export "SELECT * FROM sample" -o samples.csv.gz\n
+        cellenics rds export "SELECT * FROM sample" -f parquet -o samples.parquet
+    """
+
+    progress = _Progress()
+
+    with AuroraClient(sandbox_id, user, region, input_env, aws_profile) as client:
+        chunks = client.copy_to(query)
+
+        if output_format == PARQUET:
+            _export_parquet(chunks, output_path, compression, progress)
+        else:
+            _export_csv(chunks, output_path, compression, progress)
+
+    progress.done()
+    click.echo(click.style(f"Results exported to {output_path}.", fg="green"))
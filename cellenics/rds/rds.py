@@ -1,20 +1,46 @@
 import click
 
-from .migrator import migrator
-from .run import run
-from .token import token
-from .tunnel import tunnel
+from ..utils.lazy_group import LazyGroup
 
+LAZY_SUBCOMMANDS = {
+    "dump": (
+        "cellenics.rds.dump:dump",
+        "Dumps the database into a directory, dumping several tables in parallel.",
+    ),
+    "export": (
+        "cellenics.rds.export:export",
+        "Exports the results of a query to a compressed csv or parquet file.",
+    ),
+    "migrator": (
+        "cellenics.rds.migrator:migrator",
+        "Runs knex migration command (default to migrate:latest) in local or "
+        "staged env.",
+    ),
+    "restore": (
+        "cellenics.rds.restore:restore",
+        "Restores a dump made with `cellenics rds dump`, restoring several tables "
+        "in parallel.",
+    ),
+    "run": (
+        "cellenics.rds.run:run",
+        "Runs the provided command in the cluster using IAM if necessary.",
+    ),
+    "token": (
+        "cellenics.rds.token:token",
+        "Generates a temporary token that can be used to login to the database "
+        "(through the ssh tunnel).",
+    ),
+    "tunnel": (
+        "cellenics.rds.tunnel:tunnel",
+        "Sets up an ssh tunneling/port forwarding session for the rds server in a "
+        "given environment.",
+    ),
+}
 
-@click.group()
+
+@click.group(cls=LazyGroup, lazy_subcommands=LAZY_SUBCOMMANDS)
 def rds():
     """
     Manage Cellenics RDS databases.
     """
     pass
-
-
-rds.add_command(tunnel)
-rds.add_command(run)
-rds.add_command(token)
-rds.add_command(migrator)
@@ -0,0 +1,182 @@
+import os
+import shlex
+import tempfile
+from subprocess import run
+
+import click
+
+from ..utils.AuroraClient import AuroraClient
+from ..utils.constants import DEFAULT_AWS_PROFILE, DEVELOPMENT
+from .dump import DEFAULT_JOBS
+
+
+def _is_excluded_data(entry, exclude_tables):
+    # data entries look like "3345; 0 16390 TABLE DATA public sample dev_role"
+    fields = entry.split()
+
+    return fields[3:5] == ["TABLE", "DATA"] and fields[6] in exclude_tables
+
+
+def _write_restore_list(dump_path, exclude_tables):
+    """
+    pg_restore can't exclude tables, so the table of contents of the dump is
+    filtered instead, leaving out the data of the excluded tables.
+    Returns the path to the filtered list.
+    """
+    toc = run(
+        ["pg_restore", "--list", dump_path],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+    entries = [
+        entry
+        for entry in toc.splitlines()
+        if not _is_excluded_data(entry, exclude_tables)
+    ]
+
+    fd, list_path = tempfile.mkstemp(suffix=".list")
+    with os.fdopen(fd, "w") as list_file:
+        list_file.write("\n".join(entries) + "\n")
+
+    return list_path
+
+
+def _build_restore_command(dump_path, jobs, tables, list_path, clean):
+    command = [
+        "pg_restore",
+        "--format=directory",
+        f"--jobs={jobs}",
+        "--no-owner",
+        "--no-privileges",
+    ]
+
+    if clean:
+        command += ["--clean", "--if-exists"]
+
+    command += [f"--table={table}" for table in tables]
+
+    if list_path:
+        command.append(f"--use-list={list_path}")
+
+    command.append(dump_path)
+
+    return " ".join(shlex.quote(arg) for arg in command)
+
+
+@click.command()
+@click.option(
+    "-i",
+    "--input_env",
+    required=False,
+    default=DEVELOPMENT,
+    show_default=True,
+    help="Environment of the RDS server to restore the dump into.",
+)
+@click.option(
+    "-s",
+    "--sandbox_id",
+    required=False,
+    default="default",
+    show_default=True,
+    help="Default sandbox id.",
+)
+@click.option(
+    "-u",
+    "--user",
+    required=False,
+    default="dev_role",
+    show_default=True,
+    help="User to connect as (role is the same as user).",
+)
+@click.option(
+    "-r",
+    "--region",
+    required=False,
+    default="eu-west-1",
+    show_default=True,
+    help="Region the RDS server is in.",
+)
+@click.option(
+    "-d",
+    "--dump_path",
+    required=True,
+    help="Directory containing a dump made with `cellenics rds dump`.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    required=False,
+    default=DEFAULT_JOBS,
+    show_default=True,
+    type=int,
+    help="Number of tables restored in parallel.",
+)
+@click.option(
+    "-t",
+    "--table",
+    "tables",
+    multiple=True,
+    required=False,
+    help="Only restore this table, can be given multiple times.",
+)
+@click.option(
+    "-T",
+    "--exclude_table",
+    "exclude_tables",
+    multiple=True,
+    required=False,
+    help="Do not restore the data of this table, can be given multiple times.",
+)
+@click.option(
+    "--clean",
+    required=False,
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Drop the database objects before recreating them.",
+)
+@click.option(
+    "-p",
+    "--aws_profile",
+    required=False,
+    default=DEFAULT_AWS_PROFILE,
+    show_default=True,
+    help="The name of the profile stored in ~/.aws/credentials to use.",
+)
+def restore(
+    input_env,
+    sandbox_id,
+    user,
+    region,
+    dump_path,
+    jobs,
+    tables,
+    exclude_tables,
+    clean,
+    aws_profile,
+):
+    """
+    Restores a dump made with `cellenics rds dump`, restoring several tables in
+    parallel. By default it restores into the development (inframock) database.\n
+
+    Examples.:\n
+        cellenics rds restore -d dump/\n
+        cellenics rds restore -d dump/ --clean -T plot
+    """
+
+    list_path = None
+    if exclude_tables:
+        list_path = _write_restore_list(dump_path, exclude_tables)
+
+    command = _build_restore_command(dump_path, jobs, tables, list_path, clean)
+
+    try:
+        with AuroraClient(sandbox_id, user, region, input_env, aws_profile) as client:
+            client.run_query(command, capture_output=False, verbose=True)
+    finally:
+        if list_path:
+            os.remove(list_path)
+
+    click.echo(click.style(f"Dump {dump_path} restored.", fg="green"))
@@ -1,18 +1,92 @@
-import pathlib
+import os
 import signal
+import socket
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from subprocess import DEVNULL, run
 
 import click
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 
+from ..utils.aws import get_client
 from ..utils.constants import DEFAULT_AWS_PROFILE, STAGING
+from .token import get_rds_endpoint
+
+# Each tunnel gets its own key and ssh control socket under this prefix, so tunnels
+# to different environments/sandboxes (or from concurrent runs) don't clash
+TMP_SOCKET_PREFIX = "/tmp/cellenics-tunnel"
+
+# Tunnels opened by this process, closed on SIGINT
+_open_tunnels = set()
+
+# Postgres answers an SSLRequest with a single byte before any authentication,
+# which makes it a cheap round trip through the whole tunnel
+SSL_REQUEST = struct.pack("!ii", 8, 80877103)
+PROBE_TIMEOUT = 5
+
+# keep the ssm session from idling out and drop the tunnel if the server stops answering
+KEEPALIVE_INTERVAL = 30
+KEEPALIVE_COUNT_MAX = 3
+
+SSH_USER = "ec2-user"
+
+REQUIREMENTS_MESSAGE = """
+---------------------
+There was an error.
+---------------------
+
+Check if there were any error messages during the execution.
+
+If error is unclear please check if the aws cli and the aws ssm plugin are installed:
+Installation:
+    curl "https://s3.amazonaws.com/session-manager-downloads/plugin/latest/mac/sessionmanager-bundle.zip" -o "sessionmanager-bundle.zip"
+    unzip sessionmanager-bundle.zip
+    sudo ./sessionmanager-bundle/install -i /usr/local/sessionmanagerplugin -b /usr/local/bin/session-manager-plugin
+
+or check source for other ssm install options https://docs.aws.amazon.com/systems-manager/latest/userguide/session-manager-working-with-install-plugin.html
+"""  # noqa: E501
 
 
 def force_exit_handler(signum, frame):
-    file_dir = pathlib.Path(__file__).parent.resolve()
-    run(f"{file_dir}/cleanup_tunnel.sh", shell=True)
+    for socket_prefix in list(_open_tunnels):
+        _cleanup_tunnel(socket_prefix)
     exit()
 
 
+def find_free_port():
+    """
+    Asks the OS for a local port that is currently free.
+    """
+    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def get_socket_prefix(input_env, sandbox_id, local_port):
+    return f"{TMP_SOCKET_PREFIX}-{input_env}-{sandbox_id}-{local_port}"
+
+
+def probe_tunnel(local_port, timeout=PROBE_TIMEOUT):
+    """
+    Measures the round trip to the database server through the tunnel.
+    Returns the latency in seconds, or None if the tunnel is not responding.
+    """
+    start = time.monotonic()
+
+    try:
+        with socket.create_connection(("localhost", local_port), timeout) as sock:
+            sock.sendall(SSL_REQUEST)
+            if not sock.recv(1):
+                return None
+    except OSError:
+        return None
+
+    return time.monotonic() - start
+
+
 @click.command()
 @click.option(
     "-i",
@@ -42,9 +116,9 @@ def force_exit_handler(signum, frame):
     "-lp",
     "--local_port",
     required=False,
-    default=5432,
+    default=None,
     show_default=True,
-    help="Port to use locally for the tunnel.",
+    help="Port to use locally for the tunnel, a free one is picked by default.",
 )
 @click.option(
     "-p",
@@ -71,12 +145,16 @@ def tunnel(input_env, region, sandbox_id, local_port, aws_profile, verbose):
     cellenics rds tunnel -i staging
     """
 
+    if local_port is None:
+        local_port = find_free_port()
+
     open_tunnel(input_env, region, sandbox_id, local_port, aws_profile, verbose=verbose)
 
     input(
-        """
-Finished setting up, run \"biomage rds run psql -i $ENVIRONMENT -s $SANDBOX_ID -r
- $REGION -p $AWS_PROFILE\" in a different tab
+        f"""
+Finished setting up, the tunnel is listening on localhost:{local_port}.
+Connect to it with the password from \"cellenics rds token -i {input_env}
+ -s {sandbox_id} -r {region} -p {aws_profile}\" in a different tab
 
 ------------------------------
 Press enter to close session.
@@ -84,7 +162,51 @@ Press enter to close session.
 """
     )
 
-    close_tunnel()
+    close_tunnel(input_env, sandbox_id, local_port)
+
+
+def _get_ssm_instance(ec2_client, input_env):
+    response = ec2_client.describe_instances(
+        Filters=[
+            {"Name": "tag:Name", "Values": [f"rds-{input_env}-ssm-agent"]},
+            {"Name": "instance-state-name", "Values": ["running"]},
+        ]
+    )
+
+    for reservation in response["Reservations"]:
+        for instance in reservation["Instances"]:
+            return instance["InstanceId"], instance["Placement"]["AvailabilityZone"]
+
+    raise Exception(f"No running ssm agent instance found for {input_env}")
+
+
+def _generate_ssh_key():
+    """
+    Generates an ephemeral rsa key pair, returns the private key (openssh format)
+    and the public key (authorized_keys format).
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.OpenSSH,
+        serialization.NoEncryption(),
+    )
+    public_key = key.public_key().public_bytes(
+        serialization.Encoding.OpenSSH, serialization.PublicFormat.OpenSSH
+    )
+
+    return private_key, public_key.decode()
+
+
+def _write_private_key(key_path, private_key):
+    if os.path.exists(key_path):
+        os.remove(key_path)
+
+    # ssh refuses to use keys readable by other users
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as key_file:
+        key_file.write(private_key)
 
 
 def open_tunnel(input_env, region, sandbox_id, local_port, aws_profile, verbose=False):
@@ -94,22 +216,119 @@ def open_tunnel(input_env, region, sandbox_id, local_port, aws_profile, verbose=
     # the writer endpoint when there's a single instance and provide a false
     # sense of safety
     endpoint_type = "writer"
-    file_dir = pathlib.Path(__file__).parent.resolve()
+    socket_prefix = get_socket_prefix(input_env, sandbox_id, local_port)
 
-    run(
-        [
-            f"{file_dir}/tunnel.sh",
+    _open_tunnels.add(socket_prefix)
+
+    # don't leave the private key or the registry entry behind if it fails
+    try:
+        _start_tunnel(
+            socket_prefix,
+            endpoint_type,
             input_env,
-            sandbox_id,
             region,
-            str(local_port),
-            endpoint_type,
+            sandbox_id,
+            local_port,
             aws_profile,
+            verbose,
+        )
+    except BaseException:
+        _cleanup_tunnel(socket_prefix)
+        raise
+
+
+def _start_tunnel(
+    socket_prefix,
+    endpoint_type,
+    input_env,
+    region,
+    sandbox_id,
+    local_port,
+    aws_profile,
+    verbose,
+):
+    rds_client = get_client("rds", aws_profile, region)
+    ec2_client = get_client("ec2", aws_profile, region)
+    instance_connect_client = get_client("ec2-instance-connect", aws_profile, region)
+
+    # the lookups and the key generation are independent, run them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        endpoint_future = executor.submit(
+            get_rds_endpoint, input_env, sandbox_id, rds_client, endpoint_type
+        )
+        instance_future = executor.submit(_get_ssm_instance, ec2_client, input_env)
+        key_future = executor.submit(_generate_ssh_key)
+
+        remote_endpoint = endpoint_future.result()
+        instance_id, availability_zone = instance_future.result()
+        private_key, public_key = key_future.result()
+
+    _write_private_key(socket_prefix, private_key)
+
+    # the pushed key is only accepted by the instance for the next 60 seconds
+    instance_connect_client.send_ssh_public_key(
+        InstanceId=instance_id,
+        InstanceOSUser=SSH_USER,
+        SSHPublicKey=public_key,
+        AvailabilityZone=availability_zone,
+    )
+
+    if verbose:
+        print(f"Forwarding localhost:{local_port} to {remote_endpoint}:5432")
+
+    proxy_command = (
+        f"aws ssm start-session --target %h --region {region} --profile {aws_profile} "
+        "--document-name AWS-StartSSHSession --parameters portNumber=%p"
+    )
+
+    result = run(
+        [
+            "ssh",
+            "-i",
+            socket_prefix,
+            "-N",
+            "-f",
+            "-M",
+            "-S",
+            f"{socket_prefix}-ssh.sock",
+            "-L",
+            f"{local_port}:{remote_endpoint}:5432",
+            f"{SSH_USER}@{instance_id}",
+            "-o",
+            "IdentitiesOnly yes",
+            "-o",
+            "UserKnownHostsFile=/dev/null",
+            "-o",
+            "StrictHostKeyChecking=no",
+            "-o",
+            f"ServerAliveInterval={KEEPALIVE_INTERVAL}",
+            "-o",
+            f"ServerAliveCountMax={KEEPALIVE_COUNT_MAX}",
+            "-o",
+            "ExitOnForwardFailure=yes",
+            "-o",
+            f"ProxyCommand={proxy_command}",
         ],
         stdout=None if verbose else DEVNULL,
     )
 
+    if result.returncode != 0:
+        click.echo(click.style(REQUIREMENTS_MESSAGE, fg="yellow"))
+        raise Exception(f"Could not open the tunnel to {input_env}-{sandbox_id}")
+
+
+def close_tunnel(input_env, sandbox_id, local_port):
+    _cleanup_tunnel(get_socket_prefix(input_env, sandbox_id, local_port))
+
+
+def _cleanup_tunnel(socket_prefix):
+    socket_path = f"{socket_prefix}-ssh.sock"
+
+    if os.path.exists(socket_path):
+        run(["ssh", "-O", "exit", "-S", socket_path, "*"], stderr=DEVNULL)
+
+    for path in [socket_prefix, socket_path]:
+        if os.path.exists(path):
+            os.remove(path)
 
-def close_tunnel():
-    file_dir = pathlib.Path(__file__).parent.resolve()
-    run(f"{file_dir}/cleanup_tunnel.sh", shell=True)
+    _open_tunnels.discard(socket_prefix)
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import signal
+import sys
+import time
+from asyncio.subprocess import PIPE
+
+from .AuroraClient import (
+    MAX_RECONNECTS,
+    NO_DATA_ERROR,
+    AuroraClient,
+    _build_explain_command,
+    _build_rds_command,
+    _build_select_command,
+    _process_output_as_json,
+)
+
+# max number of queries (psql connections) running against the db at the same time
+POOL_SIZE = 4
+
+
+class AsyncAuroraClient(AuroraClient):
+    """
+    AuroraClient whose selects are coroutines, so that independent queries can
+    be gathered and run concurrently over a small pool of connections.
+    """
+
+    def __init__(self, *args, pool_size=POOL_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = pool_size
+
+    async def _run_async_query(self, query):
+        await self._ensure_tunnel()
+
+        # token generation talks to AWS, keep it off the event loop and make
+        # sure concurrent queries share a single token
+        async with self._password_lock:
+            loop = asyncio.get_running_loop()
+            password = await loop.run_in_executor(None, self.get_password)
+
+        command = _build_rds_command(
+            query, password, self.env, self.user, self.local_port
+        )
+
+        # time spent waiting for a free connection isn't part of the query time
+        async with self._pool:
+            start = time.monotonic()
+            # in its own process group, so psql can be killed along with its shell
+            proc = await asyncio.create_subprocess_shell(
+                command, stdout=PIPE, stderr=PIPE, start_new_session=True
+            )
+            try:
+                stdout, stderr = await proc.communicate()
+            except asyncio.CancelledError:
+                # don't leave psql running (and the loop waiting on its pipes)
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+                await proc.wait()
+                raise
+
+            seconds = time.monotonic() - start
+
+        if proc.returncode != 0:
+            raise Exception(stderr.decode())
+
+        return stdout.decode(), seconds
+
+    async def _reconnect(self):
+        async with self._reconnect_lock:
+            # another query might have already reconnected the tunnel
+            if self.check_tunnel():
+                return
+
+            print(
+                f"Tunnel to {self.env}-{self.sandbox_id} is down, reconnecting...",
+                file=sys.stderr,
+            )
+
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.reconnect)
+
+    async def _ensure_tunnel(self):
+        async with self._reconnect_lock:
+            loop = asyncio.get_running_loop()
+
+            if not self.tunnel_open:
+                await loop.run_in_executor(None, self.open_tunnel)
+            else:
+                await loop.run_in_executor(None, self.probe_if_idle)
+
+    async def select(self, query, as_json=True, ttl=None):
+        result = self.get_cached(query, as_json, ttl)
+
+        if result is None:
+            result = await self._select(query, as_json)
+            self.set_cached(query, as_json, ttl, result)
+
+        return result
+
+    async def select_or_empty(self, query, ttl=None):
+        try:
+            return await self.select(query, ttl=ttl)
+        except Exception as e:
+            # json_agg returns nothing when no rows match
+            if NO_DATA_ERROR not in str(e):
+                raise e
+
+            return []
+
+    async def _select(self, query, as_json):
+        self._init_pool()
+
+        select_command = _build_select_command(query, as_json)
+
+        for attempt in range(MAX_RECONNECTS + 1):
+            try:
+                output, seconds = await self._run_async_query(select_command)
+
+                result = _process_output_as_json(output)
+                self.record_query(query, seconds, output, result)
+
+                if self.explain:
+                    plan, _ = await self._run_async_query(_build_explain_command(query))
+                    self.record_plan(query, plan)
+
+                return result
+            except Exception:
+                if self.check_tunnel():
+                    raise
+
+                if attempt == MAX_RECONNECTS:
+                    raise Exception(
+                        f"Tunnel to {self.env}-{self.sandbox_id} on localhost:"
+                        f"{self.local_port} is not responding after "
+                        f"{MAX_RECONNECTS} reconnection attempts"
+                    )
+
+                await self._reconnect()
+
+    async def gather(self, *coroutines):
+        """
+        Runs the given coroutines (e.g. selects) concurrently, returning their
+        results in the same order. If any of them fails, the first error is
+        raised once all of them have finished.
+        """
+        self._init_pool()
+
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+        return results
+
+    def _init_pool(self):
+        # asyncio primitives have to be created inside the running loop
+        if getattr(self, "_pool_loop", None) is not asyncio.get_running_loop():
+            self._pool = asyncio.Semaphore(self.pool_size)
+            self._reconnect_lock = asyncio.Lock()
+            self._password_lock = asyncio.Lock()
+            self._pool_loop = asyncio.get_running_loop()
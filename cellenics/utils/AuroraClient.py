@@ -1,17 +1,102 @@
 import json
-import socket
+import os
+import re
+import shlex
 import sys
-from contextlib import closing
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from subprocess import PIPE, Popen
 from subprocess import run as sub_run
 
-import boto3
+from tabulate import tabulate
 
 from ..rds.tunnel import close_tunnel as close_tunnel_cmd
+from ..rds.tunnel import find_free_port
 from ..rds.tunnel import open_tunnel as open_tunnel_cmd
+from ..rds.tunnel import probe_tunnel
+from .aws import get_client
+from .cache import make_key
+from .constants import CACHE_LOCATION, DEVELOPMENT
 
 # we use writer because reader might also point to writer making it not safe
 ENDPOINT_TYPE = "writer"
 
+# how many times a select is retried over a fresh tunnel when the current one died
+MAX_RECONNECTS = 2
+
+DEVELOPMENT_PORT = 5431
+
+# raised by select when the query matched no rows
+NO_DATA_ERROR = "No data returned from query"
+
+# a tunnel that went unused for longer than this (in seconds) is probed before
+# the next select, so that a dropped tunnel is reopened before the query fails
+IDLE_PROBE_INTERVAL = 60
+
+# IAM auth tokens are valid for 15 minutes, refresh them a bit before that
+TOKEN_TTL = 10 * 60
+
+# selects taking longer than this (in seconds) are appended to the slow query log
+SLOW_QUERY_THRESHOLD = float(os.getenv("CELLENICS_SLOW_QUERY_THRESHOLD", 1))
+SLOW_QUERY_LOG = os.getenv(
+    "CELLENICS_SLOW_QUERY_LOG", os.path.join(CACHE_LOCATION, "slow_queries.log")
+)
+
+# size of the chunks read from psql when streaming a COPY
+COPY_CHUNK_SIZE = 1024 * 1024
+
+QueryStats = namedtuple("QueryStats", ["query", "seconds", "rows", "size"])
+
+
+def _generate_password(input_env, sandbox_id, user, region, aws_profile, verbose=True):
+    if input_env == DEVELOPMENT:
+        return "password"
+
+    rds_client = get_client("rds", aws_profile, region)
+
+    remote_endpoint = _get_rds_endpoint(
+        input_env, sandbox_id, rds_client, ENDPOINT_TYPE
+    )
+
+    if verbose:
+        print(
+            f"Generating temporary token for {input_env}-{sandbox_id}",
+            file=sys.stderr,
+        )
+
+    return rds_client.generate_db_auth_token(remote_endpoint, 5432, user, region)
+
+
+def _build_rds_command(command, password, input_env, user, local_port=None):
+    if input_env == DEVELOPMENT:
+        local_port = local_port or DEVELOPMENT_PORT
+    else:
+        local_port = local_port or 5432
+
+    return f'PGPASSWORD="{password}" {command} \
+                --host=localhost \
+                --port={local_port} \
+                --username={user} \
+                --dbname=aurora_db'
+
+
+def to_sql_array(values):
+    """
+    Builds an untyped array literal out of ids, so postgres casts it to the type
+    of the column it's compared with (e.g. WHERE id = ANY(...)).
+    """
+    for value in values:
+        if not re.match(r"^[\w-]+$", value):
+            raise Exception(f"Invalid id: {value}")
+
+    return "'{" + ",".join(values) + "}'"
+
+
+def _build_select_command(query, as_json=True):
+    return f"""psql -c "SELECT {"json_agg(q)" if as_json else "q" }
+                             FROM ( {query} ) AS q" """
+
 
 def _run_rds_command(
     command,
@@ -23,58 +108,24 @@ def _run_rds_command(
     local_port=None,
     capture_output=False,
     verbose=True,
+    password=None,
 ):
-    aws_session = boto3.Session(profile_name=aws_profile, region_name=region)
-
-    password = None
-
-    if input_env == "development":
-        password = "password"
-        local_port = local_port or 5431
-    else:
-        local_port = local_port or 5432
-
-        rds_client = aws_session.client("rds")
-
-        remote_endpoint = _get_rds_endpoint(
-            input_env, sandbox_id, rds_client, ENDPOINT_TYPE
-        )
-
-        if verbose:
-            print(
-                f"Generating temporary token for {input_env}-{sandbox_id}",
-                file=sys.stderr,
-            )
-
-        password = rds_client.generate_db_auth_token(
-            remote_endpoint, 5432, user, region
+    if password is None:
+        password = _generate_password(
+            input_env, sandbox_id, user, region, aws_profile, verbose=verbose
         )
 
     if verbose:
         print("Token generated", file=sys.stderr)
 
+    command = _build_rds_command(command, password, input_env, user, local_port)
+
     result = None
 
     if capture_output:
-        result = sub_run(
-            f'PGPASSWORD="{password}" {command} \
-                --host=localhost \
-                --port={local_port} \
-                --username={user} \
-                --dbname=aurora_db',
-            capture_output=True,
-            text=True,
-            shell=True,
-        )
+        result = sub_run(command, capture_output=True, text=True, shell=True)
     else:
-        result = sub_run(
-            f'PGPASSWORD="{password}" {command} \
-                --host=localhost \
-                --port={local_port} \
-                --username={user} \
-                --dbname=aurora_db',
-            shell=True,
-        )
+        result = sub_run(command, shell=True)
 
     if result.returncode != 0:
         raise Exception(result.stderr)
@@ -104,47 +155,120 @@ def _process_output_as_json(query_result):
     )
 
     if not json_text:
-        raise Exception("No data returned from query")
+        raise Exception(NO_DATA_ERROR)
 
     return json.loads(json_text)
 
 
-def _find_free_port():
-    for port in range(5432, 6000):
-        with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as sock:
-            res = sock.connect_ex(("localhost", port))
-            if res != 0:
-                return port
+def _build_copy_command(query):
+    return "psql -c " + shlex.quote(
+        f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)"
+    )
+
+
+def _build_explain_command(query):
+    return f"""psql -c "EXPLAIN (ANALYZE, BUFFERS) {query}" """
+
+
+def _normalize_query(query):
+    return " ".join(query.split())
+
+
+def _log_slow_query(env, sandbox_id, stats):
+    os.makedirs(os.path.dirname(SLOW_QUERY_LOG), exist_ok=True)
+
+    entry = {
+        "time": datetime.now(timezone.utc).isoformat(),
+        "env": env,
+        "sandbox_id": sandbox_id,
+        **stats._asdict(),
+    }
+
+    with open(SLOW_QUERY_LOG, "a") as log:
+        log.write(json.dumps(entry) + "\n")
 
 
 class AuroraClient:
-    def __init__(self, sandbox_id, user, region, env, aws_profile, local_port=None):
+    def __init__(
+        self,
+        sandbox_id,
+        user,
+        region,
+        env,
+        aws_profile,
+        local_port=None,
+        cache=None,
+        explain=False,
+    ):
         self.sandbox_id = sandbox_id
         self.user = user
         self.region = region
         self.env = env
         self.aws_profile = aws_profile
         self.local_port = local_port
+        self.cache = cache
+        self.tunnel_open = False
+        self.explain = explain
+        self.latencies = []
+        self.query_stats = []
+        self.query_plans = []
+        self._password = None
+        self._password_generated_at = None
+        self._last_used_at = None
 
     def __enter__(self):
-        self.open_tunnel()
+        # with a cache the tunnel is only opened once a query misses it
+        if self.cache is None:
+            self.open_tunnel()
+
         return self
 
     def __exit__(self, exc_type, exc_value, tb):
         self.close_tunnel()
 
     def open_tunnel(self):
+        # the development (inframock) database is reachable without a tunnel
+        if self.env == DEVELOPMENT:
+            self.local_port = self.local_port or DEVELOPMENT_PORT
+            self.tunnel_open = True
+            return
+
         if self.local_port is None:
-            free_port = _find_free_port()
-            if free_port is None:
-                raise Exception("No free port between 5432 and 6000")
-            self.local_port = free_port
+            self.local_port = find_free_port()
 
         open_tunnel_cmd(
             self.env, self.region, self.sandbox_id, self.local_port, self.aws_profile
         )
+        self.tunnel_open = True
+        self._last_used_at = time.monotonic()
+
+    def ensure_tunnel(self):
+        if not self.tunnel_open:
+            self.open_tunnel()
+
+    def get_password(self, verbose=False):
+        """
+        Returns an IAM auth token for the database, reusing the last one
+        generated by this client while it is still valid.
+        """
+        now = time.monotonic()
+
+        if self._password is None or now - self._password_generated_at > TOKEN_TTL:
+            self._password = _generate_password(
+                self.env,
+                self.sandbox_id,
+                self.user,
+                self.region,
+                self.aws_profile,
+                verbose=verbose,
+            )
+            self._password_generated_at = now
+
+        return self._password
 
     def run_query(self, query, capture_output=True, verbose=False):
+        self.ensure_tunnel()
+
         return _run_rds_command(
             query,
             self.sandbox_id,
@@ -155,26 +279,211 @@ class AuroraClient:
             local_port=self.local_port,
             capture_output=capture_output,
             verbose=verbose,
+            password=self.get_password(verbose=verbose),
         )
 
-    def select(self, query, as_json=True):
-        query = f"""psql -c "SELECT {"json_agg(q)" if as_json else "q" }
-                             FROM ( {query} ) AS q" """
+    def copy_to(self, query, chunk_size=COPY_CHUNK_SIZE):
+        """
+        Streams the result of the query as csv (with a header row), yielding it
+        in chunks of bytes so that it never has to be held in memory.
+        """
+        self.ensure_tunnel()
 
-        return _process_output_as_json(
-            _run_rds_command(
-                query,
-                self.sandbox_id,
-                self.env,
-                self.user,
-                self.region,
-                self.aws_profile,
-                local_port=self.local_port,
-                capture_output=True,
-                verbose=False,
+        command = _build_rds_command(
+            _build_copy_command(query),
+            self.get_password(),
+            self.env,
+            self.user,
+            self.local_port,
+        )
+
+        proc = Popen(command, stdout=PIPE, stderr=PIPE, shell=True)
+
+        try:
+            for chunk in iter(lambda: proc.stdout.read(chunk_size), b""):
+                yield chunk
+        finally:
+            proc.stdout.close()
+            stderr = proc.stderr.read()
+            proc.wait()
+
+        if proc.returncode != 0:
+            raise Exception(stderr.decode())
+
+    def check_tunnel(self):
+        """
+        Probes the tunnel and records its round trip latency.
+        Returns False if the tunnel is not responding.
+        """
+        latency = probe_tunnel(self.local_port)
+
+        if latency is None:
+            return False
+
+        self.latencies.append(latency)
+        return True
+
+    def probe_if_idle(self):
+        """
+        Health checks a tunnel that has been idle for a while, reopening it if it
+        stopped responding.
+        """
+        if not self.tunnel_open or self._last_used_at is None:
+            return
+
+        if time.monotonic() - self._last_used_at < IDLE_PROBE_INTERVAL:
+            return
+
+        if not self.check_tunnel():
+            print(
+                f"Tunnel to {self.env}-{self.sandbox_id} is down, reconnecting...",
+                file=sys.stderr,
             )
+            self.reconnect()
+
+        self._last_used_at = time.monotonic()
+
+    def reconnect(self):
+        local_port = self.local_port
+
+        self.close_tunnel()
+        self.local_port = local_port
+        self.open_tunnel()
+
+    def get_cached(self, query, as_json, ttl):
+        if not ttl or self.cache is None:
+            return None
+
+        return self.cache.get(self._cache_key(query, as_json))
+
+    def set_cached(self, query, as_json, ttl, result):
+        if not ttl or self.cache is None:
+            return
+
+        self.cache.set(self._cache_key(query, as_json), result, ttl)
+
+    def _cache_key(self, query, as_json):
+        return make_key(
+            "select", self.env, self.sandbox_id, _normalize_query(query), as_json
+        )
+
+    def select(self, query, as_json=True, ttl=None):
+        """
+        Runs the query and returns its rows. If a ttl (in seconds) is given and the
+        client has a cache, the result is served from (and stored in) the cache.
+        """
+        result = self.get_cached(query, as_json, ttl)
+
+        if result is None:
+            result = self._select(query, as_json)
+            self.set_cached(query, as_json, ttl, result)
+
+        return result
+
+    def select_or_empty(self, query, ttl=None):
+        """
+        Runs the query like select, but returns an empty list when no rows match.
+        """
+        try:
+            return self.select(query, ttl=ttl)
+        except Exception as e:
+            # json_agg returns nothing when no rows match
+            if NO_DATA_ERROR not in str(e):
+                raise e
+
+            return []
+
+    def record_query(self, query, seconds, output, result):
+        """
+        Keeps the timing and size of a select, logging it if it was slow.
+        """
+        self._last_used_at = time.monotonic()
+
+        stats = QueryStats(
+            _normalize_query(query),
+            round(seconds, 4),
+            len(result) if isinstance(result, list) else 1,
+            len(output),
         )
+        self.query_stats.append(stats)
+
+        if seconds > SLOW_QUERY_THRESHOLD:
+            _log_slow_query(self.env, self.sandbox_id, stats)
+
+    def record_plan(self, query, plan):
+        self.query_plans.append((_normalize_query(query), plan))
+
+    def print_query_report(self, file=sys.stderr):
+        """
+        Prints the stats of the selects run by this client and, in explain
+        mode, their query plans.
+        """
+        if self.query_stats:
+            print(
+                tabulate(
+                    [stats._asdict().values() for stats in self.query_stats],
+                    QueryStats._fields,
+                    tablefmt="simple",
+                    maxcolwidths=[60, None, None, None],
+                ),
+                file=file,
+            )
+
+        if self.latencies:
+            milliseconds = [latency * 1000 for latency in self.latencies]
+            print(
+                f"\nTunnel round trip over {len(milliseconds)} probes: "
+                f"min {min(milliseconds):.1f} ms, "
+                f"avg {sum(milliseconds) / len(milliseconds):.1f} ms, "
+                f"max {max(milliseconds):.1f} ms",
+                file=file,
+            )
+
+        for query, plan in self.query_plans:
+            print(f"\n{query}\n{plan}", file=file)
+
+    def _select(self, query, as_json):
+        select_command = _build_select_command(query, as_json)
+
+        self.probe_if_idle()
+
+        # selects are idempotent, so they can be retried if the tunnel dropped
+        for attempt in range(MAX_RECONNECTS + 1):
+            try:
+                start = time.monotonic()
+                output = self.run_query(select_command)
+                seconds = time.monotonic() - start
+
+                result = _process_output_as_json(output)
+                self.record_query(query, seconds, output, result)
+
+                if self.explain:
+                    self.record_plan(
+                        query, self.run_query(_build_explain_command(query))
+                    )
+
+                return result
+            except Exception:
+                if self.check_tunnel():
+                    raise
+
+                if attempt == MAX_RECONNECTS:
+                    raise Exception(
+                        f"Tunnel to {self.env}-{self.sandbox_id} on localhost:"
+                        f"{self.local_port} is not responding after "
+                        f"{MAX_RECONNECTS} reconnection attempts"
+                    )
+
+                print(
+                    f"Tunnel to {self.env}-{self.sandbox_id} is down, reconnecting...",
+                    file=sys.stderr,
+                )
+                self.reconnect()
 
     def close_tunnel(self):
-        close_tunnel_cmd()
+        if not self.tunnel_open:
+            return
+
+        close_tunnel_cmd(self.env, self.sandbox_id, self.local_port)
+        self.tunnel_open = False
         self.local_port = None
@@ -0,0 +1,86 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+from .cache import make_key
+
+# enough connections for the largest thread pools sharing a client
+MAX_POOL_CONNECTIONS = 32
+
+# account ids never change, keep them around for a long time
+ACCOUNT_ID_CACHE_TTL = 30 * 24 * 60 * 60
+
+_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+_account_ids = {}
+
+
+def _get_session(profile, region):
+    key = (profile, region)
+
+    if key not in _sessions:
+        _sessions[key] = boto3.Session(profile_name=profile, region_name=region)
+
+    return _sessions[key]
+
+
+def get_session(profile=None, region=None):
+    """
+    Returns the boto3 session of the profile and region, shared by the whole
+    process. None uses boto3's defaults (e.g. AWS_PROFILE).
+    """
+    with _lock:
+        return _get_session(profile, region)
+
+
+def get_client(service, profile=None, region=None):
+    """
+    Returns the client of the service for the profile and region, shared by the
+    whole process. Clients are thread-safe, but creating them isn't.
+    """
+    key = (service, profile, region)
+
+    with _lock:
+        if key not in _clients:
+            _clients[key] = _get_session(profile, region).client(
+                service, config=Config(max_pool_connections=MAX_POOL_CONNECTIONS)
+            )
+
+        return _clients[key]
+
+
+def _get_access_key(profile):
+    credentials = get_session(profile).get_credentials()
+
+    return credentials.access_key if credentials is not None else None
+
+
+def get_account_id(profile=None, cache=None):
+    """
+    Returns the id of the AWS account the profile belongs to, asking STS only the
+    first time it is needed for the profile's credentials.
+    """
+    # the same profile (or None) can resolve to other credentials over time, so
+    # the account id is kept per access key
+    access_key = _get_access_key(profile)
+    key = (profile, access_key)
+
+    if key in _account_ids:
+        return _account_ids[key]
+
+    if access_key is None:
+        cache = None
+
+    cache_key = make_key("aws-account-id", profile, access_key)
+    account_id = cache.get(cache_key) if cache is not None else None
+
+    if account_id is None:
+        account_id = get_client("sts", profile).get_caller_identity()["Account"]
+
+        if cache is not None:
+            cache.set(cache_key, account_id, ACCOUNT_ID_CACHE_TTL)
+
+    _account_ids[key] = account_id
+    return account_id
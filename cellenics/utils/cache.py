@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .constants import CACHE_LOCATION
+
+DEFAULT_CACHE_FILE = os.path.join(CACHE_LOCATION, "cache.sqlite")
+
+# Once the stored values go above this size, least recently used entries are evicted
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+def make_key(*parts):
+    """
+    Builds a cache key out of any json serializable parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class Cache:
+    """
+    On-disk key/value store backed by sqlite, with a TTL per entry and
+    size-based eviction. Values must be json serializable.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        Returns the value stored under key, or None if missing or expired.
+        """
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                (key, now),
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        value = json.dumps(value)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+
+        (total_size,) = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()
+
+        if total_size <= self.max_size:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM cache ORDER BY accessed_at ASC"
+        ).fetchall()
+
+        evicted = []
+        for key, size in rows:
+            if total_size <= self.max_size:
+                break
+
+            evicted.append((key,))
+            total_size -= size
+
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", evicted)
@@ -0,0 +1,289 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .aws import get_account_id, get_client
+from .cache import make_key
+from .throttling import TokenBucket, retry_throttled
+
+# user pools practically never change, user attributes only rarely
+USER_POOL_CACHE_TTL = 24 * 60 * 60
+USER_ATTRIBUTES_CACHE_TTL = 60 * 60
+
+# the email index is only rebuilt from scratch once a week, users created in
+# between are added to it as they are looked up
+USER_INDEX_CACHE_TTL = 7 * 24 * 60 * 60
+
+# concurrent requests to cognito, kept low to stay under its per-second quotas
+MAX_WORKERS = 8
+
+# cognito's default per-second quotas for the admin calls that create users and
+# update their accounts, shared by the whole AWS account
+USER_CREATION_RATE = 50
+USER_ACCOUNT_UPDATE_RATE = 25
+
+_user_creation_limiter = TokenBucket(USER_CREATION_RATE)
+_user_account_update_limiter = TokenBucket(USER_ACCOUNT_UPDATE_RATE)
+
+# user pool ids already resolved by this process, by account, region and
+# environment
+_user_pool_ids = {}
+
+
+def get_user_pool_id(env, aws_profile=None, cache=None):
+    """
+    Returns the id of the Cellenics user pool of the given environment, in the
+    account and region of the profile.
+    """
+    cognito = get_client("cognito-idp", aws_profile)
+
+    # each profile can point to another account (or region) with its own pools
+    key = (get_account_id(aws_profile, cache), cognito.meta.region_name, env)
+
+    if key in _user_pool_ids:
+        return _user_pool_ids[key]
+
+    cache_key = make_key("cognito-user-pool", *key)
+    user_pool_id = cache.get(cache_key) if cache is not None else None
+
+    if user_pool_id is None:
+        paginator = cognito.get_paginator("list_user_pools")
+
+        user_pool_id = [
+            pool["Id"]
+            for page in paginator.paginate(MaxResults=60)
+            for pool in page["UserPools"]
+            if re.match(f"biomage-.*-{env}", pool["Name"])
+        ][0]
+
+        if cache is not None:
+            cache.set(cache_key, user_pool_id, USER_POOL_CACHE_TTL)
+
+    _user_pool_ids[key] = user_pool_id
+    return user_pool_id
+
+
+@retry_throttled
+def admin_create_user(cognito, user_pool_id, email, full_name):
+    """
+    Creates a verified user without sending any email. Rate limited so it can be
+    called from many threads at once.
+    """
+    _user_creation_limiter.acquire()
+
+    cognito.admin_create_user(
+        UserPoolId=user_pool_id,
+        Username=email,
+        MessageAction="SUPPRESS",
+        UserAttributes=[
+            {"Name": "email", "Value": email},
+            {"Name": "name", "Value": full_name},
+            {"Name": "email_verified", "Value": "true"},
+        ],
+    )
+
+
+@retry_throttled
+def admin_set_user_password(cognito, user_pool_id, username, password):
+    """
+    Sets a permanent password for the user. Rate limited so it can be called
+    from many threads at once.
+    """
+    _user_account_update_limiter.acquire()
+
+    cognito.admin_set_user_password(
+        UserPoolId=user_pool_id, Username=username, Password=password, Permanent=True
+    )
+
+
+@retry_throttled
+def _get_user_attributes(cognito, user_pool_id, username):
+    user = cognito.admin_get_user(UserPoolId=user_pool_id, Username=username)
+
+    return {attr["Name"]: attr["Value"] for attr in user["UserAttributes"]}
+
+
+def get_users_attributes(
+    cognito, user_pool_id, usernames, cache=None, max_workers=MAX_WORKERS
+):
+    """
+    Fetches the attributes of each of the users concurrently.
+    Returns a dict of username to attributes, in the same order as usernames.
+    """
+    attributes = {}
+    missing = []
+
+    # the same user can show up several times, fetch it only once
+    for username in dict.fromkeys(usernames):
+        cached = None
+        if cache is not None:
+            cached = cache.get(make_key("cognito-user", user_pool_id, username))
+
+        if cached is None:
+            missing.append(username)
+        else:
+            attributes[username] = cached
+
+    def fetch(username):
+        return _get_user_attributes(cognito, user_pool_id, username)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for username, user_attributes in zip(missing, executor.map(fetch, missing)):
+            attributes[username] = user_attributes
+
+            if cache is not None:
+                cache.set(
+                    make_key("cognito-user", user_pool_id, username),
+                    user_attributes,
+                    USER_ATTRIBUTES_CACHE_TTL,
+                )
+
+    return {username: attributes[username] for username in usernames}
+
+
+@retry_throttled
+def _list_users_page(cognito, user_pool_id, **kwargs):
+    return cognito.list_users(UserPoolId=user_pool_id, **kwargs)
+
+
+def list_users(cognito, user_pool_id, attributes=None, user_filter=None):
+    """
+    Pages through the users of the pool, optionally matching a ListUsers filter
+    (e.g. 'email ^= "a"'). Yields each user as returned by cognito.
+    """
+    kwargs = {"Limit": 60}
+
+    if attributes is not None:
+        kwargs["AttributesToGet"] = attributes
+
+    if user_filter is not None:
+        kwargs["Filter"] = user_filter
+
+    while True:
+        page = _list_users_page(cognito, user_pool_id, **kwargs)
+
+        yield from page["Users"]
+
+        if "PaginationToken" not in page:
+            return
+
+        kwargs["PaginationToken"] = page["PaginationToken"]
+
+
+def _get_email(user):
+    for attribute in user.get("Attributes", []):
+        if attribute["Name"] == "email":
+            return attribute["Value"].lower()
+
+
+def _list_users_by_email(cognito, user_pool_id, emails, max_workers=MAX_WORKERS):
+    """
+    Looks up the users with the given emails. Users are listed once, split by
+    the first character of their email so that the listings run in parallel and
+    skip users that can't be in emails.
+    Returns a dict of email to user, only for emails that belong to a user.
+    """
+    emails = {email.lower() for email in emails}
+
+    # filters are case sensitive, and emails might not have been stored lowercase
+    prefixes = set()
+    for email in emails:
+        if re.match(r"^[\w.-]", email):
+            prefixes.update([email[0], email[0].upper()])
+
+    def list_prefix(prefix):
+        return [
+            (_get_email(user), user)
+            for user in list_users(
+                cognito,
+                user_pool_id,
+                attributes=["email"],
+                user_filter=f'email ^= "{prefix}"',
+            )
+        ]
+
+    users = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for prefix_users in executor.map(list_prefix, sorted(prefixes)):
+            users.update(
+                (email, user) for email, user in prefix_users if email in emails
+            )
+
+    return users
+
+
+def list_usernames_by_email(cognito, user_pool_id, emails, max_workers=MAX_WORKERS):
+    """
+    Returns a dict of email to username, only for emails that belong to a user.
+    """
+    users = _list_users_by_email(cognito, user_pool_id, emails, max_workers)
+
+    return {email: user["Username"] for email, user in users.items()}
+
+
+def get_user_statuses(cognito, user_pool_id, emails, max_workers=MAX_WORKERS):
+    """
+    Returns a dict of email to the status of its user (e.g. CONFIRMED, or
+    FORCE_CHANGE_PASSWORD if no password was ever set), only for emails that
+    already belong to a user of the pool.
+    """
+    users = _list_users_by_email(cognito, user_pool_id, emails, max_workers)
+
+    return {email: user["UserStatus"] for email, user in users.items()}
+
+
+def _find_username(cognito, user_pool_id, email):
+    # only finds users whose email was stored lowercase, filters are case sensitive
+    users = list(list_users(cognito, user_pool_id, user_filter=f'email = "{email}"'))
+
+    return users[0]["Username"] if users else None
+
+
+def get_usernames_by_email(
+    cognito, user_pool_id, emails, cache=None, max_workers=MAX_WORKERS
+):
+    """
+    Resolves emails to usernames through an index of the whole user pool, kept in
+    the cache and built with ListUsers. Emails missing from the index (e.g. users
+    created after it was built) are looked up one by one and added to it. Those
+    that aren't found are looked up again ignoring case.
+    Returns a dict of email to username (None if there's no such user).
+    """
+    emails = [email.lower() for email in emails]
+    cache_key = make_key("cognito-user-index", user_pool_id)
+
+    index = cache.get(cache_key) if cache is not None else None
+
+    if index is None:
+        index = {"built_at": time.time(), "usernames": {}}
+
+        for user in list_users(cognito, user_pool_id, attributes=["email"]):
+            email = _get_email(user)
+            if email is not None:
+                index["usernames"][email] = user["Username"]
+
+    usernames = index["usernames"]
+    missing = [email for email in dict.fromkeys(emails) if email not in usernames]
+
+    def find(email):
+        return _find_username(cognito, user_pool_id, email)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for email, username in zip(missing, executor.map(find, missing)):
+            if username is not None:
+                usernames[email] = username
+
+    # the email might have been stored with another case
+    not_found = [email for email in missing if email not in usernames]
+    if not_found:
+        usernames.update(
+            list_usernames_by_email(cognito, user_pool_id, not_found, max_workers)
+        )
+
+    if cache is not None:
+        # keep the expiry of the index at a week since it was fully built
+        ttl = index["built_at"] + USER_INDEX_CACHE_TTL - time.time()
+        cache.set(cache_key, index, ttl)
+
+    return {email: usernames.get(email) for email in emails}
@@ -1,3 +1,5 @@
+import os
+
 # Constant names of environments
 DEVELOPMENT = "development"
 STAGING = "staging"
@@ -12,3 +14,11 @@ RAW_FILES_BUCKET = "biomage-source"
 PROCESSED_FILES_BUCKET = "processed-matrix"
 FILTERED_CELLS_BUCKET = "biomage-filtered-cells"
 CELLSETS_BUCKET = "cell-sets"
+
+# Local on-disk caches (query results, lookups)
+CACHE_LOCATION = os.getenv(
+    "CELLENICS_CACHE_PATH", os.path.join(os.path.expanduser("~"), ".cache", "cellenics")
+)
+
+# How long read-only metadata (e.g. an experiment's samples) is served from the cache
+METADATA_CACHE_TTL = 60 * 60
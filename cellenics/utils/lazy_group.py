@@ -0,0 +1,56 @@
+import importlib
+
+import click
+from click.utils import make_default_short_help
+
+
+class LazyGroup(click.Group):
+    """
+    Click group whose subcommands are only imported when they are invoked.
+    lazy_subcommands maps each command name to its "module:attribute" import path
+    and to the help shown when listing the commands, so that --help doesn't
+    import them either.
+    """
+
+    def __init__(self, *args, lazy_subcommands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands and cmd_name not in self.commands:
+            self.add_command(self._load(cmd_name), cmd_name)
+
+        return super().get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        names = self.list_commands(ctx)
+        if not names:
+            return
+
+        limit = formatter.width - 6 - max(len(name) for name in names)
+
+        rows = []
+        for name in names:
+            if name in self.commands:
+                command = self.commands[name]
+                if command.hidden:
+                    continue
+
+                short_help = command.get_short_help_str(limit)
+            else:
+                _, help = self.lazy_subcommands[name]
+                short_help = make_default_short_help(help, limit)
+
+            rows.append((name, short_help))
+
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+    def _load(self, cmd_name):
+        import_path, _ = self.lazy_subcommands[cmd_name]
+        module_name, attribute = import_path.split(":")
+
+        return getattr(importlib.import_module(module_name), attribute)
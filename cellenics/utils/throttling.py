@@ -0,0 +1,48 @@
+import threading
+import time
+
+import backoff
+from botocore.exceptions import ClientError
+
+THROTTLING_ERRORS = ["TooManyRequestsException", "ThrottlingException"]
+
+
+def _is_not_throttling(error):
+    return error.response["Error"]["Code"] not in THROTTLING_ERRORS
+
+
+# Retries AWS calls with exponential backoff when they are throttled
+retry_throttled = backoff.on_exception(
+    backoff.expo, ClientError, max_tries=8, giveup=_is_not_throttling
+)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. acquire blocks until a token is available, so that
+    calls made from any number of threads stay under rate calls per second.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = (1 - self._tokens) / self.rate
+
+            time.sleep(wait)
@@ -27,5 +27,6 @@ setup(
     install_requires=requirements,
     extras_require={
         "dev": dev_requirements,
+        "export": ["pyarrow", "zstandard"],
     },
 )
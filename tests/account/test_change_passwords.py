@@ -0,0 +1,24 @@
+import threading
+
+from cellenics.account import account
+
+
+def test_passwords_are_yielded_before_the_chunk_is_done(monkeypatch):
+    release = threading.Event()
+
+    def set_user_password(cognito, userpool, username, password):
+        if username == "slow@galaxy.gl":
+            assert release.wait(10)
+
+    monkeypatch.setattr(account, "admin_set_user_password", set_user_password)
+
+    results = account._set_passwords(
+        None, "pool", ["arthur@galaxy.gl", "ford@galaxy.gl", "slow@galaxy.gl"]
+    )
+
+    # the first users are done while the last one is still waiting
+    assert next(results)[1] is None
+    assert next(results)[1] is None
+
+    release.set()
+    assert next(results)[1] is None
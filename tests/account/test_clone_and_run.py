@@ -0,0 +1,72 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from cellenics.account import account
+
+
+@pytest.fixture(autouse=True)
+def no_backoff_wait(monkeypatch):
+    monkeypatch.setattr("time.sleep", lambda seconds: None)
+
+
+def _http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+
+    return requests.exceptions.HTTPError(response=response)
+
+
+def _connection_refused():
+    reason = NewConnectionError(None, "Connection refused")
+    return requests.exceptions.ConnectionError(MaxRetryError(None, "/", reason))
+
+
+class FakeExperiment:
+    def __init__(self, errors):
+        self.id = "clone-id"
+        self.errors = list(errors)
+        self.clones = 0
+        self.runs = 0
+
+    def clone(self, user_id):
+        self.clones += 1
+
+        if self.errors:
+            raise self.errors.pop(0)
+
+        return self
+
+    def run(self):
+        self.runs += 1
+
+
+@pytest.mark.parametrize(
+    "error",
+    [_connection_refused(), requests.exceptions.ConnectTimeout(), _http_error(429)],
+)
+def test_requests_the_api_never_processed_are_retried(error):
+    experiment = FakeExperiment([error])
+
+    assert account._clone_and_run(experiment, "user") == ("clone-id", "started")
+    assert experiment.clones == 2
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        requests.exceptions.ReadTimeout(),
+        requests.exceptions.ConnectionError("Connection aborted."),
+        _http_error(500),
+        _http_error(504),
+    ],
+)
+def test_requests_the_api_might_have_processed_are_not_retried(error):
+    experiment = FakeExperiment([error])
+
+    experiment_id, status = account._clone_and_run(experiment, "user")
+
+    assert experiment_id is None
+    assert status.startswith("clone failed")
+    assert experiment.clones == 1
+    assert experiment.runs == 0
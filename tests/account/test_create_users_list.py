@@ -0,0 +1,169 @@
+import csv
+
+import pytest
+
+from cellenics.account import account
+
+
+class FakeCognito:
+    """
+    Keeps the status of the accounts, failing the steps of the emails in
+    failing_accounts and failing_passwords.
+    """
+
+    def __init__(self):
+        self.statuses = {}
+        self.failing_accounts = set()
+        self.failing_passwords = set()
+        self.created = []
+
+    def create_account(self, full_name, email, aws_profile, userpool, cognito):
+        if email in self.failing_accounts:
+            raise Exception("TooManyRequestsException")
+
+        self.created.append(email)
+        self.statuses[email] = "FORCE_CHANGE_PASSWORD"
+
+    def change_password(self, email, password, aws_profile, userpool, cognito):
+        if email in self.failing_passwords:
+            raise Exception("TooManyRequestsException")
+
+        self.statuses[email] = "CONFIRMED"
+
+    def get_user_statuses(self, cognito, userpool, emails):
+        return {
+            email: self.statuses[email] for email in emails if email in self.statuses
+        }
+
+
+@pytest.fixture
+def cognito(monkeypatch):
+    cognito = FakeCognito()
+
+    monkeypatch.setattr(account, "get_client", lambda *args: None)
+    monkeypatch.setattr(account, "_get_userpool", lambda *args: "pool")
+    monkeypatch.setattr(account, "get_user_statuses", cognito.get_user_statuses)
+    monkeypatch.setattr(account, "create_account", cognito.create_account)
+    monkeypatch.setattr(account, "_change_password", cognito.change_password)
+
+    return cognito
+
+
+def _write_user_list(tmp_path, rows):
+    user_list = tmp_path / "users.csv"
+    user_list.write_text("".join(f"{name},{email}\n" for name, email in rows))
+
+    return str(user_list)
+
+
+def _read_out(user_list):
+    with open(user_list + ".out") as f:
+        return [line.split(",")[:2] for line in f.read().splitlines()]
+
+
+USERS = [
+    ("Arthur Dent", "arthur@galaxy.gl"),
+    ("Ford Prefect", "ford@galaxy.gl"),
+    ("Zaphod Beeblebrox", "zaphod@galaxy.gl"),
+]
+
+
+def test_failed_rows_are_retried_from_errors_file(tmp_path, cognito):
+    user_list = _write_user_list(tmp_path, USERS)
+    cognito.failing_accounts.add("ford@galaxy.gl")
+
+    with pytest.raises(SystemExit):
+        account._create_users_list(user_list, None, "staging", "default", False)
+
+    assert _read_out(user_list) == [
+        ["Arthur Dent", "arthur@galaxy.gl"],
+        ["Zaphod Beeblebrox", "zaphod@galaxy.gl"],
+    ]
+
+    cognito.failing_accounts.clear()
+    errors_path = user_list + ".errors"
+    account._create_users_list(errors_path, None, "staging", "default", False)
+
+    assert _read_out(errors_path) == [["Ford Prefect", "ford@galaxy.gl"]]
+
+
+def test_rerun_keeps_passwords_of_earlier_runs(tmp_path, cognito):
+    user_list = _write_user_list(tmp_path, USERS)
+    cognito.failing_accounts.add("ford@galaxy.gl")
+
+    with pytest.raises(SystemExit):
+        account._create_users_list(user_list, None, "staging", "default", False)
+
+    with open(user_list + ".out") as f:
+        first_run = f.read()
+
+    cognito.failing_accounts.clear()
+    account._create_users_list(user_list, None, "staging", "default", True)
+
+    with open(user_list + ".out") as f:
+        out = f.read()
+
+    assert out.startswith(first_run)
+    assert "ford@galaxy.gl,Tmp_" in out
+
+
+def test_checkpoint_round_trip(tmp_path):
+    checkpoint_path = str(tmp_path / "users.csv.checkpoint")
+
+    assert account._read_checkpoint(checkpoint_path) == 0
+
+    account._write_checkpoint(checkpoint_path, 42)
+
+    assert account._read_checkpoint(checkpoint_path) == 42
+    assert not (tmp_path / "users.csv.checkpoint.tmp").exists()
+
+
+def test_interrupted_import_resumes_after_checkpoint(tmp_path, monkeypatch, cognito):
+    user_list = _write_user_list(tmp_path, USERS)
+    write_checkpoint = account._write_checkpoint
+
+    def interrupted(checkpoint_path, rows_done):
+        write_checkpoint(checkpoint_path, rows_done)
+        raise KeyboardInterrupt()
+
+    # one user per chunk, so the interrupted run doesn't get to the next users
+    monkeypatch.setattr(account, "CHUNK_SIZE", 1)
+    monkeypatch.setattr(account, "_write_checkpoint", interrupted)
+
+    with pytest.raises(KeyboardInterrupt):
+        account._create_users_list(user_list, None, "staging", "default", False)
+
+    assert account._read_checkpoint(user_list + ".checkpoint") == 1
+
+    monkeypatch.setattr(account, "_write_checkpoint", write_checkpoint)
+    account._create_users_list(user_list, None, "staging", "default", False)
+
+    # the first user isn't created twice, and the outputs of both runs add up
+    assert cognito.created == [email for _, email in USERS]
+    assert _read_out(user_list) == [list(user) for user in USERS]
+    assert not (tmp_path / "users.csv.checkpoint").exists()
+    assert not (tmp_path / "users.csv.errors").exists()
+
+
+def test_accounts_without_password_get_one_on_retry(tmp_path, cognito):
+    user_list = _write_user_list(tmp_path, USERS)
+    cognito.failing_passwords.add("ford@galaxy.gl")
+
+    with pytest.raises(SystemExit):
+        account._create_users_list(user_list, None, "staging", "default", False)
+
+    errors_path = user_list + ".errors"
+    with open(errors_path) as f:
+        [[full_name, email, row, step, _]] = list(csv.reader(f))
+
+    assert (email, row, step) == ("ford@galaxy.gl", "2", "set_password")
+
+    cognito.failing_passwords.clear()
+    account._create_users_list(errors_path, None, "staging", "default", False)
+
+    # the account isn't created again, only its password is set
+    assert cognito.created == [email for _, email in USERS]
+    assert cognito.statuses["ford@galaxy.gl"] == "CONFIRMED"
+
+    with open(errors_path + ".out") as f:
+        assert f.read().startswith("Ford Prefect,ford@galaxy.gl,Tmp_")
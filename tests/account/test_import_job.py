@@ -0,0 +1,108 @@
+import csv
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pandas as pd
+import pytest
+
+from cellenics.account import account
+
+CSV_HEADER = [
+    "name",
+    "given_name",
+    "email",
+    "email_verified",
+    "phone_number_verified",
+    "cognito:mfa_enabled",
+    "cognito:username",
+]
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    """
+    Stands in for the presigned S3 url the import job csv is uploaded to.
+    """
+
+    uploads = []
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.uploads.append((self.path, dict(self.headers), body.decode()))
+
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def presigned_url():
+    S3Handler.uploads = []
+
+    server = HTTPServer(("localhost", 0), S3Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://localhost:{server.server_port}/import.csv?X-Amz-Signature=abc"
+
+    server.shutdown()
+    server.server_close()
+
+
+class FakeCognito:
+    def __init__(self, presigned_url, status="Succeeded"):
+        self.presigned_url = presigned_url
+        self.status = status
+        self.started = []
+
+    def get_csv_header(self, UserPoolId):
+        return {"CSVHeader": CSV_HEADER}
+
+    def create_user_import_job(self, JobName, UserPoolId, CloudWatchLogsRoleArn):
+        return {"UserImportJob": {"JobId": "job-1", "PreSignedUrl": self.presigned_url}}
+
+    def start_user_import_job(self, UserPoolId, JobId):
+        self.started.append(JobId)
+
+    def describe_user_import_job(self, UserPoolId, JobId):
+        return {"UserImportJob": {"JobId": JobId, "Status": self.status}}
+
+
+USERS = pd.DataFrame(
+    {
+        "row": [1, 2],
+        "full_name": ["Arthur Dent", "Ford Prefect"],
+        "email": ["arthur@galaxy.gl", "ford@galaxy.gl"],
+    }
+)
+
+
+def test_import_csv_fills_known_columns():
+    rows = list(csv.DictReader(io.StringIO(account._to_import_csv(USERS, CSV_HEADER))))
+
+    assert list(rows[0]) == CSV_HEADER
+    assert rows[1]["cognito:username"] == "ford@galaxy.gl"
+    assert rows[1]["name"] == "Ford Prefect"
+    assert rows[1]["email_verified"] == "true"
+    assert rows[1]["given_name"] == ""
+
+
+def test_import_job_uploads_csv_to_presigned_url(presigned_url):
+    cognito = FakeCognito(presigned_url)
+
+    account._run_import_job(cognito, "pool", USERS, "arn:aws:iam::0:role/Import")
+
+    [(path, headers, body)] = S3Handler.uploads
+    assert path == "/import.csv?X-Amz-Signature=abc"
+    assert headers["x-amz-server-side-encryption"] == "aws:kms"
+    assert body == account._to_import_csv(USERS, CSV_HEADER)
+    assert cognito.started == ["job-1"]
+
+
+def test_failed_import_job_raises(presigned_url):
+    cognito = FakeCognito(presigned_url, status="Failed")
+
+    with pytest.raises(Exception, match="finished as Failed"):
+        account._run_import_job(cognito, "pool", USERS, "arn:aws:iam::0:role/Import")
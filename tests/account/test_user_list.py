@@ -0,0 +1,79 @@
+import pytest
+
+from cellenics.account import account
+
+
+def _write_user_list(tmp_path, lines):
+    user_list = tmp_path / "users.csv"
+    user_list.write_text("".join(f"{line}\n" for line in lines))
+
+    return str(user_list)
+
+
+def test_valid_user_list_has_no_errors(tmp_path):
+    user_list = _write_user_list(
+        tmp_path, ["arthur dent,Arthur@Galaxy.gl", "Ford Prefect,ford@galaxy.gl"]
+    )
+
+    assert account._validate_user_list(user_list, None).empty
+
+
+def test_invalid_rows_are_reported_with_their_row(tmp_path):
+    user_list = _write_user_list(
+        tmp_path,
+        [
+            "Arthur Dent,arthur@galaxy.gl",
+            "Ford Prefect,not-an-email",
+            ",zaphod@galaxy.gl",
+            "Trillian,",
+        ],
+    )
+
+    invalid = account._validate_user_list(user_list, None)
+
+    assert list(invalid["row"]) == [2, 3, 4]
+    assert list(invalid["error"]) == [
+        "ERROR: Email not-an-email does not match regex",
+        "ERROR: Full name not provided for user zaphod@galaxy.gl",
+        "ERROR: Email not provided for user Trillian",
+    ]
+
+
+def test_duplicates_are_found_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(account, "CHUNK_SIZE", 2)
+
+    user_list = _write_user_list(
+        tmp_path,
+        [
+            "Arthur Dent,arthur@galaxy.gl",
+            "Ford Prefect,ford@galaxy.gl",
+            "Arthur Again,ARTHUR@galaxy.gl",
+            "Ford Again,ford@galaxy.gl",
+        ],
+    )
+
+    invalid = account._validate_user_list(user_list, None)
+
+    assert list(invalid["row"]) == [3, 4]
+    assert list(invalid["error"]) == [
+        "ERROR: Email arthur@galaxy.gl is duplicated",
+        "ERROR: Email ford@galaxy.gl is duplicated",
+    ]
+
+
+def test_rows_already_done_are_not_validated(tmp_path):
+    user_list = _write_user_list(
+        tmp_path, ["Ford Prefect,not-an-email", "Arthur Dent,arthur@galaxy.gl"]
+    )
+
+    assert account._validate_user_list(user_list, None, rows_done=1).empty
+
+
+def test_invalid_list_exits_before_creating_accounts(tmp_path):
+    user_list = _write_user_list(tmp_path, ["Ford Prefect,not-an-email"])
+
+    with pytest.raises(SystemExit):
+        account._exit_if_invalid(user_list, None)
+
+    with open(user_list + ".invalid") as f:
+        assert "does not match regex" in f.read()
@@ -0,0 +1,37 @@
+import asyncio
+
+from cellenics.experiment.info import _get_experiments_bulk
+
+
+class FakeAuroraClient:
+    cache = None
+
+    async def select_or_empty(self, query, ttl=None):
+        if "FROM experiment WHERE" in query:
+            return [
+                {
+                    "experiment_id": "found",
+                    "experiment_name": "Found",
+                    "created_at": "2026-01-01",
+                    "pod_cpus": None,
+                    "pod_memory": None,
+                }
+            ]
+
+        return []
+
+    async def gather(self, *coroutines):
+        return await asyncio.gather(*coroutines)
+
+
+def test_bulk_documents_name_their_experiment():
+    documents = asyncio.run(
+        _get_experiments_bulk(FakeAuroraClient(), ["missing", "found"], "production")
+    )
+
+    assert [document["experiment_id"] for document in documents] == [
+        "missing",
+        "found",
+    ]
+    assert documents[0]["info"] is None
+    assert documents[1]["info"]["experiment_name"] == "Found"
@@ -0,0 +1,83 @@
+from botocore.exceptions import ClientError
+
+from cellenics.experiment import usage as usage_module
+from cellenics.experiment.usage import _get_usage
+
+
+class FakeAuroraClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def select_or_empty(self, query):
+        self.queries.append(query)
+        return self.rows
+
+
+class FakeS3Client:
+    def __init__(self, objects):
+        self.objects = objects
+        self.listed = []
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+        return {"ContentLength": self.objects[(Bucket, Key)]}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix):
+        self.listed.append((Bucket, Prefix))
+
+        contents = [
+            {"Key": key, "Size": size}
+            for (bucket, key), size in self.objects.items()
+            if bucket == Bucket and key.startswith(Prefix)
+        ]
+
+        return [{"Contents": contents}]
+
+
+def test_sample_files_are_sized_through_their_s3_paths(monkeypatch):
+    originals = "biomage-originals-production-000"
+
+    # the clone shares the sample files of the original experiment
+    aurora_client = FakeAuroraClient(
+        [
+            {"experiment_id": "original", "s3_path": "sample-a/matrix.mtx.gz"},
+            {"experiment_id": "original", "s3_path": "sample-a/barcodes.tsv.gz"},
+            {"experiment_id": "clone", "s3_path": "sample-a/matrix.mtx.gz"},
+            {"experiment_id": "clone", "s3_path": "sample-a/missing.tsv.gz"},
+        ]
+    )
+    s3client = FakeS3Client(
+        {
+            (originals, "sample-a/matrix.mtx.gz"): 1000,
+            (originals, "sample-a/barcodes.tsv.gz"): 24,
+            ("cell-sets-production-000", "original"): 5,
+        }
+    )
+
+    monkeypatch.setattr(usage_module, "AuroraClient", aurora_client)
+    monkeypatch.setattr(usage_module, "get_client", lambda *args: s3client)
+
+    usage = _get_usage(["original", "clone"], "production", "default", "000")
+
+    assert usage["original"]["samples"] == (2, 1024)
+    assert usage["clone"]["samples"] == (1, 1000)
+    assert usage["original"]["cellsets"] == (1, 5)
+    assert usage["clone"]["cellsets"] == (0, 0)
+
+    assert len(aurora_client.queries) == 1
+    assert all(bucket != originals for bucket, _ in s3client.listed)
@@ -0,0 +1,62 @@
+import os
+
+import pyarrow.parquet as pq
+import pytest
+
+from cellenics.rds.export import _export_csv, _export_parquet, _Progress
+
+
+def _chunked(data, size=64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def test_column_null_in_first_block_is_exported(tmp_path):
+    # more than a block of rows with an empty name before the first filled in one
+    data = b"id,name\n" + b"1,\n" * 500_000 + b'2,"late name"\n'
+    output_path = tmp_path / "out.parquet"
+
+    _export_parquet(_chunked(data), output_path, "none", _Progress())
+
+    table = pq.read_table(output_path)
+    assert table.num_rows == 500_001
+    assert table.column("name")[0].as_py() is None
+    assert table.column("name")[-1].as_py() == "late name"
+    assert table.column("id")[-1].as_py() == "2"
+
+
+def test_query_without_rows_exports_columns(tmp_path):
+    output_path = tmp_path / "out.parquet"
+
+    _export_parquet(iter([b"id,name\n"]), output_path, "none", _Progress())
+
+    table = pq.read_table(output_path)
+    assert table.column_names == ["id", "name"]
+    assert table.num_rows == 0
+
+
+def test_failed_export_removes_partial_file(tmp_path):
+    output_path = tmp_path / "out.parquet"
+
+    def failing():
+        yield from _chunked(b"id,name\n" + b"1,a\n" * 500_000)
+        raise Exception("connection to server was lost")
+
+    with pytest.raises(Exception, match="connection to server was lost"):
+        _export_parquet(failing(), output_path, "none", _Progress())
+
+    assert not os.path.exists(output_path)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_failed_csv_export_removes_partial_file(tmp_path, compression):
+    output_path = tmp_path / "out.csv.gz"
+
+    def failing():
+        yield b"id,name\n1,a\n"
+        raise Exception("psql exited with 1")
+
+    with pytest.raises(Exception, match="psql exited with 1"):
+        _export_csv(failing(), output_path, compression, _Progress())
+
+    assert not os.path.exists(output_path)
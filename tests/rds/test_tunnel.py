@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from cellenics.rds import tunnel
+
+
+class FakeInstanceConnect:
+    def send_ssh_public_key(self, **kwargs):
+        raise Exception("AccessDeniedException")
+
+
+@pytest.fixture
+def socket_prefix(tmp_path, monkeypatch):
+    socket_prefix = str(tmp_path / "tunnel-staging-default-5432")
+
+    monkeypatch.setattr(tunnel.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(tunnel, "get_socket_prefix", lambda *args: socket_prefix)
+    monkeypatch.setattr(tunnel, "get_client", lambda *args: FakeInstanceConnect())
+    monkeypatch.setattr(tunnel, "get_rds_endpoint", lambda *args: "aurora.local")
+    monkeypatch.setattr(
+        tunnel, "_get_ssm_instance", lambda *args: ("i-123", "eu-west-1a")
+    )
+
+    return socket_prefix
+
+
+def test_failed_tunnel_removes_key_and_registry_entry(socket_prefix):
+    with pytest.raises(Exception, match="AccessDeniedException"):
+        tunnel.open_tunnel("staging", "eu-west-1", "default", 5432, "default")
+
+    assert socket_prefix not in tunnel._open_tunnels
+    assert not os.path.exists(socket_prefix)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cellenics.utils import AsyncAuroraClient as async_aurora_module
+from cellenics.utils.AsyncAuroraClient import AsyncAuroraClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = AsyncAuroraClient("default", "dev_role", "eu-west-1", "staging", "default")
+
+    async def ensure_tunnel():
+        pass
+
+    # run the query as a shell command instead of psql
+    monkeypatch.setattr(client, "_ensure_tunnel", ensure_tunnel)
+    monkeypatch.setattr(client, "get_password", lambda: "")
+    monkeypatch.setattr(client, "check_tunnel", lambda: True)
+    monkeypatch.setattr(
+        async_aurora_module, "_build_select_command", lambda query, as_json: query
+    )
+    monkeypatch.setattr(
+        async_aurora_module, "_build_rds_command", lambda query, *args: query
+    )
+
+    return client
+
+
+def _psql_output(json_text):
+    return f"printf 'json_agg\\n--------\\n{json_text}\\n(1 row)\\n'"
+
+
+def _run_in_thread(coroutine, timeout):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = asyncio.run(coroutine)
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    assert not thread.is_alive(), "event loop hung"
+    return outcome
+
+
+def test_gather_raises_failed_select_without_hanging(client):
+    outcome = _run_in_thread(
+        client.gather(
+            client.select("echo 'syntax error' >&2; exit 1"),
+            client.select(f"sleep 1; {_psql_output('[1]')}"),
+        ),
+        timeout=10,
+    )
+
+    assert "syntax error" in str(outcome["error"])
+
+
+def test_gather_returns_results_in_order(client):
+    outcome = _run_in_thread(
+        client.gather(
+            client.select(f"sleep 0.2; {_psql_output('[1]')}"),
+            client.select(_psql_output("[2]")),
+        ),
+        timeout=10,
+    )
+
+    assert outcome["result"] == [[1], [2]]
+
+
+def test_cancelled_query_kills_psql(client):
+    async def cancel_slow_query():
+        client._init_pool()
+
+        task = asyncio.create_task(client._run_async_query("sleep 30"))
+        await asyncio.sleep(0.5)
+        task.cancel()
+
+        start = time.monotonic()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        return time.monotonic() - start
+
+    outcome = _run_in_thread(cancel_slow_query(), timeout=10)
+
+    assert outcome["result"] < 5
@@ -0,0 +1,54 @@
+import io
+
+from cellenics.utils import AuroraClient as aurora_module
+from cellenics.utils.AuroraClient import IDLE_PROBE_INTERVAL, AuroraClient
+
+
+def _open_client(monkeypatch, latency):
+    client = AuroraClient("default", "dev_role", "eu-west-1", "staging", "default")
+    client.tunnel_open = True
+    client.local_port = 5432
+
+    monkeypatch.setattr(aurora_module, "probe_tunnel", lambda port: latency)
+
+    return client
+
+
+def test_idle_tunnel_is_probed_and_latency_recorded(monkeypatch):
+    client = _open_client(monkeypatch, 0.012)
+    client._last_used_at = 0
+
+    client.probe_if_idle()
+
+    assert client.latencies == [0.012]
+
+
+def test_recently_used_tunnel_is_not_probed(monkeypatch):
+    client = _open_client(monkeypatch, 0.012)
+    client._last_used_at = aurora_module.time.monotonic()
+
+    client.probe_if_idle()
+
+    assert client.latencies == []
+
+
+def test_dead_idle_tunnel_is_reopened(monkeypatch):
+    client = _open_client(monkeypatch, None)
+    client._last_used_at = aurora_module.time.monotonic() - IDLE_PROBE_INTERVAL - 1
+
+    reconnects = []
+    monkeypatch.setattr(client, "reconnect", lambda: reconnects.append(True))
+
+    client.probe_if_idle()
+
+    assert reconnects == [True]
+
+
+def test_query_report_shows_tunnel_latencies(monkeypatch):
+    client = _open_client(monkeypatch, 0.01)
+    client.latencies = [0.01, 0.03]
+
+    report = io.StringIO()
+    client.print_query_report(file=report)
+
+    assert "min 10.0 ms, avg 20.0 ms, max 30.0 ms" in report.getvalue()
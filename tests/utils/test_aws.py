@@ -0,0 +1,59 @@
+import pytest
+
+from cellenics.utils import aws
+from cellenics.utils.cache import Cache
+
+
+class FakeSTS:
+    def __init__(self):
+        self.calls = 0
+
+    def get_caller_identity(self):
+        self.calls += 1
+        return {"Account": f"account-of-{aws._get_access_key(None)}"}
+
+
+@pytest.fixture
+def sts(monkeypatch):
+    monkeypatch.setattr(aws, "_sessions", {})
+    monkeypatch.setattr(aws, "_account_ids", {})
+
+    sts = FakeSTS()
+    monkeypatch.setattr(aws, "_clients", {("sts", None, None): sts})
+
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "secret")
+
+    return sts
+
+
+def _use_access_key(monkeypatch, access_key):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", access_key)
+
+    # sessions resolve their credentials once, start a new one
+    monkeypatch.setattr(aws, "_sessions", {})
+
+
+def test_account_id_is_cached_on_disk(tmp_path, monkeypatch, sts):
+    cache = Cache(str(tmp_path / "cache.sqlite"))
+    _use_access_key(monkeypatch, "AKIA1")
+
+    assert aws.get_account_id(None, cache) == "account-of-AKIA1"
+
+    # a new process only has the disk cache
+    monkeypatch.setattr(aws, "_account_ids", {})
+
+    assert aws.get_account_id(None, cache) == "account-of-AKIA1"
+    assert sts.calls == 1
+
+
+def test_other_credentials_dont_share_the_cached_account(tmp_path, monkeypatch, sts):
+    cache = Cache(str(tmp_path / "cache.sqlite"))
+
+    _use_access_key(monkeypatch, "AKIA1")
+    assert aws.get_account_id(None, cache) == "account-of-AKIA1"
+
+    _use_access_key(monkeypatch, "AKIA2")
+    assert aws.get_account_id(None, cache) == "account-of-AKIA2"
+
+    assert sts.calls == 2
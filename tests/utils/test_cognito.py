@@ -0,0 +1,100 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cellenics.utils import cognito as cognito_module
+from cellenics.utils.cache import Cache
+
+ACCOUNTS = {"default": "000", "other": "111"}
+
+
+class FakeCognito:
+    def __init__(self, pools):
+        self.meta = SimpleNamespace(region_name="eu-west-1")
+        self.pools = pools
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, MaxResults):
+        return [{"UserPools": self.pools}]
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    clients = {
+        profile: FakeCognito(
+            [{"Id": f"pool-{account_id}", "Name": "biomage-user-pool-production"}]
+        )
+        for profile, account_id in ACCOUNTS.items()
+    }
+
+    monkeypatch.setattr(cognito_module, "_user_pool_ids", {})
+    monkeypatch.setattr(
+        cognito_module, "get_client", lambda service, profile: clients[profile]
+    )
+    monkeypatch.setattr(
+        cognito_module, "get_account_id", lambda profile, cache: ACCOUNTS[profile]
+    )
+
+    return clients
+
+
+def test_user_pool_is_cached_per_account(tmp_path, clients):
+    cache = Cache(str(tmp_path / "cache.sqlite"))
+
+    assert cognito_module.get_user_pool_id("production", "default", cache) == "pool-000"
+    assert cognito_module.get_user_pool_id("production", "other", cache) == "pool-111"
+
+    # a new process only has the disk cache
+    cognito_module._user_pool_ids.clear()
+    clients["default"].pools = []
+
+    assert cognito_module.get_user_pool_id("production", "default", cache) == "pool-000"
+
+
+class FakeUserPool:
+    """
+    Answers ListUsers with case sensitive filters, like cognito.
+    """
+
+    def __init__(self, users):
+        self.users = users
+
+    def list_users(self, UserPoolId, Limit, Filter=None, AttributesToGet=None):
+        operator, value = Filter.replace("email ", "").split(" ")
+        value = value.strip('"')
+
+        return {
+            "Users": [
+                {
+                    "Username": username,
+                    "Attributes": [{"Name": "email", "Value": email}],
+                }
+                for email, username in self.users.items()
+                if (email == value if operator == "=" else email.startswith(value))
+            ]
+        }
+
+
+def test_emails_stored_with_another_case_are_found(tmp_path):
+    cache = Cache(str(tmp_path / "cache.sqlite"))
+    cognito = FakeUserPool({"arthur@galaxy.gl": "u1", "Ford.Prefect@Galaxy.gl": "u2"})
+
+    # an index built before the users were created
+    cache.set(
+        cognito_module.make_key("cognito-user-index", "pool"),
+        {"built_at": time.time(), "usernames": {}},
+        60,
+    )
+
+    usernames = cognito_module.get_usernames_by_email(
+        cognito, "pool", ["Arthur@galaxy.gl", "ford.prefect@galaxy.gl", "x@y.z"], cache
+    )
+
+    assert usernames == {
+        "arthur@galaxy.gl": "u1",
+        "ford.prefect@galaxy.gl": "u2",
+        "x@y.z": None,
+    }